@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Golden outputs of the benchmark suite, computed by the original web app.
+Run as python -m benchmarks.baseline_golden CHECKOUT
+
+CHECKOUT is a checkout of the web app before the diagism package, for example
+git worktree add /tmp/baseline <baseline commit>. The catalogues of the suite
+are predicted with its create_mocks and the computations of its model pages,
+and saved to benchmarks/golden.npz, the reference of python -m benchmarks.suite.
+@author: Andres Felipe Ramos Padilla
+"""
+import argparse
+import importlib.util
+import os
+import pickle
+from ast import literal_eval
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.suite import GOLDEN_FILE, GOLDEN_SIZES, PARAMETER, SELECTED, pattern_catalogue
+from diagism.columns import DICT_CONV, DICT_PAR
+
+
+def baseline_defs(checkout):
+    """pages/defs.py of the original web app"""
+    spec = importlib.util.spec_from_file_location('baseline_defs',
+                                                  os.path.join(checkout, 'pages', 'defs.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def baseline_table(checkout, defs, model, df):
+    """Result table of a catalogue, as computed by the page of a model"""
+    from astropy.table import Table
+    from sklearn import preprocessing
+    from sklearn.neural_network import MLPRegressor
+
+    dataset = Table.read(os.path.join(checkout, 'files', 'complete_dataset.fits'),
+                         format='fits')
+    dataset['log(1+z)'] = np.log10(dataset['z']+1)
+    if model == 'eight':
+        df_user = df.reindex(columns=list(DICT_CONV))
+    else:
+        # The redshift is moved last, the lines keep the order of the catalogue
+        df_user = df.copy()
+        df_user.insert(len(df_user.columns)-1, 'z', df_user.pop('z'))
+    listc = [DICT_CONV[col] for col in df_user.columns]
+    x_df = dataset[listc].to_pandas()
+    y_df = dataset.to_pandas()[DICT_PAR[PARAMETER]].values.reshape(-1, 1)
+    scalerx = preprocessing.RobustScaler()
+    scalery = preprocessing.RobustScaler()
+    x_scale = scalerx.fit_transform(x_df.values)
+    y_scale = scalery.fit_transform(y_df)
+
+    hyp_tab = Table.read(os.path.join(checkout, 'files', 'Hyperparameters_table.csv'),
+                         format='ascii.csv')
+    loc_hyp = np.where(hyp_tab['Parameter'] == DICT_PAR[PARAMETER])[0][0]
+    if model == 'eight':
+        with open(os.path.join(checkout, 'files', 'AllLines_trained'), 'rb') as file:
+            regr_mlp = pickle.load(file)[loc_hyp]
+    else:
+        regr_mlp = MLPRegressor(random_state=42,
+                                hidden_layer_sizes=literal_eval(
+                                    hyp_tab[loc_hyp]['hidden_layer_sizes']),
+                                activation=hyp_tab[loc_hyp]['activation'],
+                                solver='adam',
+                                alpha=hyp_tab[loc_hyp]['alpha'],
+                                batch_size=hyp_tab[loc_hyp]['batch_size'],
+                                learning_rate_init=hyp_tab[loc_hyp]['learning_rate_init'],
+                                max_iter=hyp_tab[loc_hyp]['max_iter'])
+        regr_mlp.fit(x_scale, y_scale.ravel())
+
+    faked = defs.create_mocks(df_user.to_numpy(), x_df, sys_error=model == 'selected')
+    rows = []
+    for gal in range(faked.shape[0]):
+        individual = regr_mlp.predict(scalerx.transform(faked[gal]))
+        trans_indiv = scalery.inverse_transform(individual.reshape(-1, 1))
+        rows.append({"per_16th": np.quantile(trans_indiv, 0.16),
+                     "median": np.median(trans_indiv),
+                     "per_84th": np.quantile(trans_indiv, 0.84),
+                     "mean": np.mean(trans_indiv), "std": np.std(trans_indiv)})
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('checkout', help='checkout of the original web app')
+    args = parser.parse_args()
+
+    defs = baseline_defs(args.checkout)
+    golden = {}
+    for model in ('eight', 'selected'):
+        for ngal in GOLDEN_SIZES:
+            df = pattern_catalogue(ngal, SELECTED if model == 'selected' else None)
+            golden['%s_%i' % (model, ngal)] = baseline_table(args.checkout, defs, model,
+                                                             df).to_numpy()
+            print('%s model, %i galaxies done' % (model, ngal))
+    np.savez(GOLDEN_FILE, **golden)
+
+
+if __name__ == '__main__':
+    main()
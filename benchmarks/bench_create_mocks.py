@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the mock generation against the previous per galaxy loop.
+Run as python -m benchmarks.bench_create_mocks [--ngal 10 100 1000]
+
+The mocks are not bit-identical to those of the loop: the neighbour statistics
+are summed in another order than pandas describe(), which changes the last
+digits. The "agree" column checks that every mock is within a relative RTOL of
+the loop, and the largest relative difference is also reported.
+@author: Andres Felipe Ramos Padilla
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from diagism.columns import COL_ANALT
+from diagism.mocks import create_mocks
+from diagism.resources import feature_frame, feature_index
+
+RTOL = 1e-12
+
+
+def legacy_create_mocks(values, features, sigma=0.2, sys_error=False):
+    """Per galaxy and per column implementation used before the vectorisation"""
+    nlines = values.shape[1]
+    np.random.seed(42)
+    nrows = 2000
+    rows = np.zeros((values.shape[0], nrows, nlines))
+    for igal in range(values.shape[0]):
+        loc_cols = np.unique(np.where(~np.isnan(values[igal]))[0])[:-1]
+        cond1 = (features[features.columns[loc_cols]] <= values[igal][loc_cols]+sigma).all(axis=1)
+        cond2 = (features[features.columns[loc_cols]] >= values[igal][loc_cols]-sigma).all(axis=1)
+        info = features[cond1 & cond2].describe()
+        if info.isnull().values.any():
+            bad_sol = pd.DataFrame([values[igal]]).describe()
+            bad_sol.loc['mean'] = np.nanmean(values[igal][:-1])
+            bad_sol.loc['std'] = max(np.nanstd(values[igal][:-1]), 0.05)
+            info = bad_sol
+        for col in range(nlines):
+            sigma2 = np.sqrt(sigma**2 + info.loc['std'][col]**2)
+            rand_lum = np.random.normal(info.loc['mean'][col], sigma2, nrows)
+            if ~np.isnan(values[igal][col]):
+                if col == nlines-1:
+                    rows[igal, :, col] = values[igal][col]
+                else:
+                    if sys_error:
+                        rows[igal, :, col] = np.random.normal(
+                            values[igal][col], sigma, nrows)
+                    else:
+                        rows[igal, :, col] = np.random.normal(
+                            values[igal][col], 0.01, nrows)
+            else:
+                rows[igal, :, col] = rand_lum
+    return rows
+
+
+def synthetic_catalogue(features, ngal, nan_fraction=0.3, seed=0):
+    """Catalogue of perturbed simulated galaxies with missing luminosities"""
+    rng = np.random.default_rng(seed)
+    values = features.values[rng.integers(0, len(features), ngal)].copy()
+    values[:, :-1] += rng.normal(0, 0.1, (ngal, values.shape[1]-1))
+    missing = rng.random((ngal, values.shape[1]-1)) < nan_fraction
+    # Keep at least one luminosity per galaxy
+    missing[np.arange(ngal), rng.integers(0, values.shape[1]-1, ngal)] = False
+    values[:, :-1][missing] = np.nan
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ngal', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--skip-legacy', action='store_true',
+                        help='only time the vectorised implementation')
+    args = parser.parse_args()
+
+    features = feature_frame(COL_ANALT)
+    index = feature_index(COL_ANALT)
+    print('%8s %8s %14s %14s %10s %10s %12s' % ('ngal', 'sys_err', 'legacy [gal/s]',
+                                                'new [gal/s]', 'speed-up', 'agree',
+                                                'max rel diff'))
+    for ngal in args.ngal:
+        values = synthetic_catalogue(features, ngal)
+        for sys_error in (False, True):
+            start = time.perf_counter()
+            rows, _ = create_mocks(values, index, 0.2, sys_error)
+            new_time = time.perf_counter() - start
+            if args.skip_legacy:
+                print('%8i %8s %14s %14.1f %10s %10s %12s' % (ngal, sys_error, '-',
+                                                              ngal/new_time, '-', '-', '-'))
+                continue
+            start = time.perf_counter()
+            old_rows = legacy_create_mocks(values, features, 0.2, sys_error)
+            old_time = time.perf_counter() - start
+            with np.errstate(invalid='ignore', divide='ignore'):
+                relative = np.nanmax(np.abs(rows - old_rows) / np.abs(old_rows))
+            print('%8i %8s %14.1f %14.1f %10.1f %10s %12.1e' % (
+                ngal, sys_error, ngal/old_time, ngal/new_time, old_time/new_time,
+                np.allclose(rows, old_rows, rtol=RTOL, atol=0, equal_nan=True), relative))
+
+
+if __name__ == '__main__':
+    main()
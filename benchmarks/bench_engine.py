@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the NumPy inference engine against the scikit-learn pipeline.
+Run as python -m benchmarks.bench_engine [--ngal 10 100] [--parameter SFR]
+@author: Andres Felipe Ramos Padilla
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_create_mocks import synthetic_catalogue
+from diagism.artifacts import x_scaler, y_scaler
+from diagism.columns import COL_ANALT, DICT_PAR
+from diagism.engine import eight_lines_engine
+from diagism.inference import ScaledRegressor, predict_mocks
+from diagism.mocks import create_mocks
+from diagism.resources import feature_frame, feature_index, load_models, model_index
+
+
+def _best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ngal', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--parameter', default='SFR', choices=list(DICT_PAR))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    column = DICT_PAR[args.parameter]
+    sklearn_model = ScaledRegressor(x_scaler(COL_ANALT), load_models()[model_index(column)],
+                                    y_scaler(column))
+    engine = eight_lines_engine(column)
+    single = engine.astype(np.float32)
+    models = [('sklearn', sklearn_model), ('numpy', engine), ('numpy float32', single)]
+
+    print('%8s %14s %12s %10s %14s' % ('ngal', 'engine', 'time [s]', 'gal/s', 'max |diff|'))
+    for ngal in args.ngal:
+        values = synthetic_catalogue(feature_frame(COL_ANALT), ngal)
+        faked, _ = create_mocks(values, feature_index(COL_ANALT))
+        reference = None
+        for name, model in models:
+            elapsed, predictions = _best_time(lambda: predict_mocks(faked, model), args.repeat)
+            if reference is None:
+                reference = predictions
+            print('%8i %14s %12.4f %10.1f %14.3g' % (
+                ngal, name, elapsed, ngal/elapsed, np.max(np.abs(predictions - reference))))
+
+
+if __name__ == '__main__':
+    main()
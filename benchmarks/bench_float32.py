@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Accuracy and memory of the float32 pipeline against the float64 one.
+Run as python -m benchmarks.bench_float32 [--ngal 1000] [--parameters SFR ISRF]
+
+Both pipelines predict the same catalogue with the same mocks (the normals are
+drawn in float64 and rounded), so the differences of the quantile tables only
+come from the precision. The largest absolute difference of every statistic
+must stay below ATOL, in the units of the parameter (dex for most of them);
+the command fails otherwise. The peak memory of both predictions is reported.
+@author: Andres Felipe Ramos Padilla
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from benchmarks.suite import SELECTED, pattern_catalogue
+from diagism import output
+from diagism.api import Predictor
+from diagism.columns import DICT_PAR
+from diagism.instrument import StageTimer
+
+ATOL = 1e-3
+STATS = ('per_16th', 'median', 'per_84th', 'mean', 'std')
+
+
+def compare(model, ngal, parameters, chunk_galaxies):
+    """{parameter: {statistic: max |float32 - float64|}} and the peak memory of both"""
+    columns = SELECTED if model == 'selected' else None
+    df = pattern_catalogue(ngal, columns)
+    timer = StageTimer(trace_memory=True)
+    tables = {}
+    for dtype in ('float64', 'float32'):
+        predictor = Predictor(parameters, model, list(df.columns), galaxy_seeds=True,
+                              dtype=dtype, chunk_galaxies=chunk_galaxies)
+        with timer.stage(dtype):
+            tables[dtype] = predictor.predict(df, 0)[0]
+    diffs = {}
+    for param in parameters:
+        prefix = '' if len(parameters) == 1 else output.column_prefix(param)
+        diffs[param] = {stat: float(np.nanmax(np.abs(tables['float32'][prefix+stat]
+                                                     - tables['float64'][prefix+stat])))
+                        for stat in STATS}
+    return diffs, {dtype: timer.stages[dtype] for dtype in tables}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ngal', type=int, default=1000)
+    parser.add_argument('--models', nargs='+', default=['eight', 'selected'],
+                        choices=['eight', 'selected'])
+    parser.add_argument('--parameters', nargs='+', default=list(DICT_PAR),
+                        choices=list(DICT_PAR))
+    parser.add_argument('--chunk-galaxies', type=int, default=200,
+                        help='galaxies drawn at once, which bounds the memory')
+    args = parser.parse_args()
+
+    failed = False
+    for model in args.models:
+        diffs, stages = compare(model, args.ngal, args.parameters, args.chunk_galaxies)
+        print('%s model, %i galaxies: float64 %.2f s %.1f MB, float32 %.2f s %.1f MB' % (
+            model, args.ngal, stages['float64']['seconds'], stages['float64']['peak_mb'],
+            stages['float32']['seconds'], stages['float32']['peak_mb']))
+        print('%-20s' % 'max |diff|' + ''.join('%12s' % stat for stat in STATS))
+        for param, stat_diffs in diffs.items():
+            print('%-20s' % param + ''.join('%12.2e' % stat_diffs[stat] for stat in STATS))
+            failed |= max(stat_diffs.values()) > ATOL
+    print('All the differences below %g' % ATOL if not failed
+          else 'Some differences are above %g' % ATOL)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scaling of the parallel predictions with the number of worker processes.
+Run as python -m benchmarks.bench_parallel [--ngal 5000] [--workers 1 2 4 8]
+@author: Andres Felipe Ramos Padilla
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_create_mocks import synthetic_catalogue
+from diagism.api import Predictor
+from diagism.columns import COL_ANALT, DICT_CONV
+from diagism.parallel import default_workers, predict_parallel
+from diagism.resources import feature_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ngal', type=int, default=5000)
+    parser.add_argument('--workers', type=int, nargs='+')
+    parser.add_argument('--chunksize', type=int, default=250)
+    parser.add_argument('--parameter', default='SFR')
+    args = parser.parse_args()
+    workers = args.workers or sorted({1, 2, 4, default_workers()})
+
+    values = synthetic_catalogue(feature_frame(COL_ANALT), args.ngal)
+    df = pd.DataFrame(values, columns=list(DICT_CONV))
+    predictor = Predictor(args.parameter, 'eight', list(df.columns), galaxy_seeds=True)
+
+    print('%8s %12s %10s %10s %10s' % ('workers', 'time [s]', 'gal/s', 'speed-up', 'identical'))
+    reference = None
+    for nworkers in workers:
+        start = time.perf_counter()
+        if nworkers == 1:
+            result, _ = predictor.predict(df, 0)
+        else:
+            result, _ = predict_parallel(predictor, df, nworkers, args.chunksize)
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference, ref_time = result, elapsed
+        print('%8i %12.2f %10.1f %10.2f %10s' % (
+            nworkers, elapsed, args.ngal/elapsed, ref_time/elapsed,
+            np.allclose(result.values, reference.values, rtol=0, atol=1e-12)))
+
+
+if __name__ == '__main__':
+    main()
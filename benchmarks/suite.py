@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of the whole prediction pipeline, without Streamlit.
+Run as python -m benchmarks.suite [--sizes 1 100 10000 100000] [--output results.json]
+
+For every model and catalogue size it reports the time to load the models, the
+throughput, the percentiles of the latency of a chunk of galaxies and the peak
+memory, as JSON. The catalogues are simulated galaxies with the missing
+luminosities of the example input files. The small catalogues are also
+predicted with the single random stream of the pages and compared with the
+golden outputs of the original web app (benchmarks.baseline_golden), so a
+faster pipeline can be shown to give the same results. A missing golden output
+is a failure, unless --update-golden saves the current predictions instead.
+@author: Andres Felipe Ramos Padilla
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from diagism.api import Predictor
+from diagism.columns import COL_ANALT, DICT_CONV
+from diagism.ingest import Ingestion
+from diagism.instrument import StageTimer
+from diagism.resources import FILES_DIR, feature_matrix
+
+SIZES = (1, 100, 10000, 100000)
+GOLDEN_SIZES = (1, 100)
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden.npz')
+EXAMPLES = ('example_input1.csv', 'example_input2.csv')
+# Lines of example_input2.csv, used by the selected lines model, in the order
+# the models are trained with (the original pages used the order of the file)
+SELECTED = ['Lum_OIII_88', 'Lum_OI_145', 'Lum_CII_158', 'z']
+PARAMETER = 'SFR'
+CHUNK_SIZE = 1000
+ATOL = 1e-6
+
+
+def example_patterns():
+    """Known columns of every galaxy of the example input files, as boolean rows"""
+    patterns = []
+    for name in EXAMPLES:
+        df = Ingestion(os.path.join(FILES_DIR, name)).read()
+        patterns.append(df.reindex(columns=list(DICT_CONV)).notna().to_numpy())
+    return np.concatenate(patterns)
+
+
+def pattern_catalogue(ngal, columns=None, seed=0):
+    """Catalogue of perturbed simulated galaxies with the gaps of the examples"""
+    rng = np.random.default_rng(seed)
+    features = feature_matrix(COL_ANALT)
+    values = features[rng.integers(0, len(features), ngal)].copy()
+    values[:, :-1] += rng.normal(0, 0.1, (ngal, values.shape[1]-1))
+    patterns = example_patterns()
+    values[~patterns[rng.integers(0, len(patterns), ngal)]] = np.nan
+    df = pd.DataFrame(values, columns=list(DICT_CONV))
+    if columns is not None:
+        df = df[columns]
+        # Every galaxy needs at least one value
+        df = df[df.notna().any(axis=1)]
+    return df.reset_index(drop=True)
+
+
+def run(model, ngal, repeat=20):
+    """Timings of one model and catalogue size, and its catalogue"""
+    columns = SELECTED if model == 'selected' else None
+    df = pattern_catalogue(ngal, columns)
+    timer = StageTimer(trace_memory=True)
+    with timer.stage('model load'):
+        predictor = Predictor(PARAMETER, model, list(df.columns), galaxy_seeds=True)
+    latencies = []
+    with timer.stage('prediction'):
+        for first in range(0, len(df), CHUNK_SIZE):
+            chunk = df.iloc[first:first+CHUNK_SIZE]
+            start = time.perf_counter()
+            predictor.predict(chunk, first)
+            latencies.append(time.perf_counter() - start)
+    # A single chunk gives no spread, so small catalogues are predicted again
+    while len(latencies) < repeat and len(df) <= CHUNK_SIZE:
+        start = time.perf_counter()
+        predictor.predict(df, 0)
+        latencies.append(time.perf_counter() - start)
+    stages = timer.stages
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    result = {'model': model, 'ngal': len(df), 'chunk_size': min(CHUNK_SIZE, len(df)),
+              'load_seconds': stages['model load']['seconds'],
+              'predict_seconds': stages['prediction']['seconds'],
+              'galaxies_per_second': len(df)/stages['prediction']['seconds'],
+              'latency_p50': p50, 'latency_p95': p95, 'latency_p99': p99,
+              'peak_mb': max(stage['peak_mb'] for stage in stages.values())}
+    return result, df
+
+
+def check_golden(key, model, df, golden, update):
+    """Compare the result table of a catalogue with its golden output.
+
+    The catalogue is predicted as the pages do, with a single random stream.
+    update saves the table as the golden output instead.
+    """
+    table = Predictor(PARAMETER, model, list(df.columns)).predict(df)[0]
+    if update:
+        golden[key] = table.to_numpy()
+        return 'updated'
+    if key not in golden:
+        return 'missing'
+    reference = golden[key]
+    same = reference.shape == table.shape and np.allclose(table.to_numpy(), reference,
+                                                          rtol=0, atol=ATOL, equal_nan=True)
+    return 'ok' if same else 'DIFFERENT'
+
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--models', nargs='+', default=['eight', 'selected'],
+                        choices=['eight', 'selected'])
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='predictions timed for the catalogues of a single chunk')
+    parser.add_argument('--output', help='JSON file with the results (default: stdout)')
+    parser.add_argument('--update-golden', action='store_true',
+                        help='save the predictions of the small catalogues as golden '
+                             'outputs, instead of comparing them')
+    args = parser.parse_args()
+
+    golden = {}
+    if os.path.exists(GOLDEN_FILE):
+        with np.load(GOLDEN_FILE) as npz:
+            golden = {key: npz[key] for key in npz.files}
+    results = []
+    for model in args.models:
+        for ngal in args.sizes:
+            result, df = run(model, ngal, args.repeat)
+            if ngal in GOLDEN_SIZES:
+                result['golden'] = check_golden('%s_%i' % (model, ngal), model, df, golden,
+                                                args.update_golden)
+            results.append(result)
+            print('%-8s %7i galaxies: %10.1f gal/s, p50 %.4f s, peak %.1f MB%s' % (
+                model, result['ngal'], result['galaxies_per_second'], result['latency_p50'],
+                result['peak_mb'], ', golden %s' % result['golden'] if 'golden' in result
+                else ''), file=sys.stderr)
+    if args.update_golden:
+        np.savez(GOLDEN_FILE, **golden)
+
+    report = json.dumps({'environment': environment(), 'results': results}, indent=1)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report + '\n')
+    else:
+        print(report)
+    if any(result.get('golden') in ('DIFFERENT', 'missing') for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
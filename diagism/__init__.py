@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DiagISM library code shared by the pages of the web app.
+@author: Andres Felipe Ramos Padilla
+"""
+
+_API = ('predict', 'predict_csv', 'Predictor')
+
+
+def __getattr__(name):
+    # The prediction API pulls in sklearn and astropy, so it is only imported when used
+    if name in _API:
+        from diagism import api
+        return getattr(api, name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line tools of DiagISM.
+Run as python -m diagism <command>
+@author: Andres Felipe Ramos Padilla
+"""
+import argparse
+import sys
+
+from diagism import artifacts, engine, formats, model_store, resources
+from diagism.columns import DICT_CONV, DICT_PAR
+
+
+def build_artifacts(args):
+    """Precompute the scalers and scores used by the pages"""
+    print('Artifacts saved to %s' % artifacts.build_artifacts(args.output))
+
+
+def convert_dataset(args):
+    """Convert the simulation dataset to memory-mapped columns"""
+    print('Columns saved to %s' % resources.convert_dataset(args.dataset))
+
+
+def export_engine(args):
+    """Export the eight FIR lines models for the NumPy inference engine"""
+    dtype = 'float32' if args.float32 else 'float64'
+    print('Weights saved to %s' % engine.export_models(args.output, dtype))
+    for param, column in DICT_PAR.items():
+        print('%-20s max |numpy - sklearn| = %.3g' % (
+            param, engine.compare_sklearn(column, engine.eight_lines_engine(column, args.output))))
+
+
+def serve(args):
+    """Run the HTTP prediction service"""
+    import asyncio
+    from diagism import service
+    try:
+        asyncio.run(service.serve(args.host, args.port, batch_wait=args.batch_wait,
+                                  max_batch=args.max_batch, threads=args.threads))
+    except KeyboardInterrupt:
+        pass
+
+
+def build_grid(args):
+    """Precompute the quantile grid of a set of lines for the sidebar values"""
+    from diagism import grid
+    path = grid.build_grid(args.model, args.lines, args.parameters, args.sigma, args.step,
+                           log=lambda text: print(text, file=sys.stderr))
+    print('Grid saved to %s' % path)
+
+
+def import_times(args):
+    """Report the time taken to import the pages and their dependencies"""
+    from diagism import startup
+    print(startup.import_report(args.modules or startup.PAGES, args.top))
+
+
+def warm(args):
+    """Train and store the selected FIR lines models of every line subset"""
+    store = model_store.ModelStore(args.store_dir, disk_size=args.disk_size)
+    parameters = [DICT_PAR[param] for param in args.parameters] if args.parameters else None
+    model_store.warm(store, parameters, args.min_lines)
+
+
+def predict(args):
+    """Predict physical parameters for every galaxy of a CSV catalogue"""
+    from diagism.api import predict_csv
+    ngal = predict_csv(args.input, args.output, args.parameter, args.model, args.sigma,
+                       chunksize=args.chunksize, workers=args.workers,
+                       galaxy_seeds=not args.single_stream, tolerance=args.tolerance,
+                       dtype='float32' if args.float32 else 'float64',
+                       fmt=args.format, samples=args.samples,
+                       log=lambda text: print(text, file=sys.stderr))
+    print('Predictions of %i galaxies saved to %s' % (ngal, args.output))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m diagism', description='DiagISM tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('predict', help=predict.__doc__)
+    command.add_argument('input', help='CSV file with the format of the CSV information page')
+    command.add_argument('output', help='file with the results (.csv, .csv.gz, .parquet '
+                                        'or .fits)')
+    command.add_argument('--parameter', nargs='+', default=['SFR'], choices=list(DICT_PAR),
+                         help='one or several parameters, predicted from the same mocks')
+    command.add_argument('--model', default='eight', choices=['eight', 'selected'])
+    command.add_argument('--sigma', type=float, default=0.2, help='assumed error [dex]')
+    command.add_argument('--chunksize', type=int, default=1000,
+                         help='galaxies read and predicted at once')
+    command.add_argument('--workers', type=int, default=1,
+                         help='processes predicting chunks in parallel')
+    command.add_argument('--single-stream', action='store_true',
+                         help='one random stream for the whole catalogue, as the pages, '
+                              'instead of one per galaxy (one worker only)')
+    command.add_argument('--tolerance', type=float,
+                         help='adaptive number of mocks: stop when the percentiles move '
+                              'less than this fraction of the 16th-84th interval')
+    command.add_argument('--float32', action='store_true',
+                         help='draw and predict the mocks in single precision')
+    command.add_argument('--format', choices=list(formats.FORMATS),
+                         help='format of the output (default: from its extension)')
+    command.add_argument('--samples', action='store_true',
+                         help='also save the prediction of every mock (Parquet and FITS)')
+    command.set_defaults(func=predict)
+
+    command = commands.add_parser('serve', help=serve.__doc__)
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8000)
+    command.add_argument('--batch-wait', type=float, default=0.01,
+                         help='seconds a request waits for others to predict together')
+    command.add_argument('--max-batch', type=int, default=5000,
+                         help='galaxies that trigger a batch without waiting')
+    command.add_argument('--threads', type=int, default=1,
+                         help='batches predicted at the same time')
+    command.set_defaults(func=serve)
+
+    command = commands.add_parser('build-artifacts', help=build_artifacts.__doc__)
+    command.add_argument('--output', default=artifacts.ARTIFACTS_FILE)
+    command.set_defaults(func=build_artifacts)
+
+    command = commands.add_parser('convert-dataset', help=convert_dataset.__doc__)
+    command.add_argument('--dataset', default=resources.DATASET_FILE,
+                         help='FITS file, converted to a .columns directory next to it')
+    command.set_defaults(func=convert_dataset)
+
+    command = commands.add_parser('export-engine', help=export_engine.__doc__)
+    command.add_argument('--output', default=engine.ENGINE_FILE)
+    command.add_argument('--float32', action='store_true',
+                         help='store the weights (and predict) in single precision')
+    command.set_defaults(func=export_engine)
+
+    command = commands.add_parser('build-grid', help=build_grid.__doc__)
+    command.add_argument('--model', default='eight', choices=['eight', 'selected'])
+    command.add_argument('--lines', nargs='+', required=True, choices=list(DICT_CONV),
+                         help='columns given in the sidebar, z included')
+    command.add_argument('--parameters', nargs='+', choices=list(DICT_PAR),
+                         help='parameters in the grid (default: all)')
+    command.add_argument('--sigma', type=float, default=0.2, help='assumed error [dex]')
+    command.add_argument('--step', type=float, default=0.5,
+                         help='spacing of the luminosity nodes [dex]')
+    command.set_defaults(func=build_grid)
+
+    command = commands.add_parser('import-times', help=import_times.__doc__)
+    command.add_argument('modules', nargs='*', help='modules to import (default: the pages)')
+    command.add_argument('--top', type=int, default=20,
+                         help='number of packages and modules listed')
+    command.set_defaults(func=import_times)
+
+    command = commands.add_parser('warm', help=warm.__doc__)
+    command.add_argument('--parameters', nargs='+', choices=list(DICT_PAR),
+                         help='parameters to train (default: all)')
+    command.add_argument('--min-lines', type=int, default=2,
+                         help='smallest number of input columns, redshift included')
+    command.add_argument('--store-dir', default=model_store.STORE_DIR)
+    command.add_argument('--disk-size', type=int, default=model_store.DISK_SIZE,
+                         help='maximum size of the store in bytes')
+    command.set_defaults(func=warm)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
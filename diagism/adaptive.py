@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Predictions with an adaptive number of mocks per galaxy.
+
+Instead of a fixed number of mocks, the mocks are drawn and predicted in
+batches, and a galaxy stops once none of its 16th, 50th and 84th percentiles
+moves by more than tolerance times the 16th-84th interval after a new batch.
+Galaxies with narrow, stable predictions stop after a couple of batches and
+the others get more mocks, up to max_rows.
+Every galaxy keeps its own random stream (as GalaxyStreams), so the result of
+a galaxy does not depend on the other galaxies or on the chunks.
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+
+from diagism.inference import QUANTILES, predict_mocks
+from diagism.mocks import SEED, GalaxyStreams, draw_mocks, mock_stats
+
+BATCH_ROWS = 500
+MAX_ROWS = 20000
+TOLERANCE = 0.02
+
+
+class _PersistentStreams(GalaxyStreams):
+    """Random stream of each galaxy, continued from one batch to the next"""
+
+    def __init__(self, ngal, seed=SEED, first=0):
+        super().__init__(seed, first)
+        self.generators = [np.random.default_rng([seed, first+igal]) for igal in range(ngal)]
+        # Galaxies drawn by the next calls, in order
+        self.active = np.arange(ngal)
+
+    def standard_normal(self, counts):
+        """Normals of the next len(counts) active galaxies, as GalaxyStreams"""
+        galaxies, self.active = self.active[:len(counts)], self.active[len(counts):]
+        normals = np.empty(int(np.sum(counts)))
+        start = 0
+        for igal, count in zip(galaxies, counts):
+            normals[start:start+count] = self.generators[igal].standard_normal(count)
+            start += count
+        return normals
+
+
+def adaptive_predictions(values, features, models, sigma=0.2, sys_error=False,
+                         tolerance=TOLERANCE, batch_rows=BATCH_ROWS, max_rows=MAX_ROWS,
+                         seed=SEED, first=0, dtype=np.float64):
+    """Predictions of every galaxy with as many mocks as its percentiles need.
+
+    models is a {name: model} dict of models predicting in physical units,
+    which all see the same mocks; a galaxy stops when the percentiles of all of
+    them have converged. first is the row of the first galaxy in the whole
+    catalogue. Returns a {name: list of 1D arrays} dict with the predictions of
+    each galaxy, the number of mocks of each galaxy, and the indices of the
+    galaxies without similar simulated galaxies. dtype is the precision of the
+    mocks and predictions.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ngal = len(values)
+    mean, std, missing = mock_stats(values, features, sigma)
+
+    streams = _PersistentStreams(ngal, seed, first)
+    samples = {name: [None]*ngal for name in models}
+    running = {name: np.empty((ngal, 0), dtype=dtype) for name in models}
+    previous = {name: np.full((ngal, len(QUANTILES)), np.nan) for name in models}
+    nmocks = np.zeros(ngal, dtype=int)
+    active = np.arange(ngal)
+    while len(active):
+        streams.active = active
+        cube = draw_mocks(values[active], mean[active], std[active], sigma, sys_error,
+                          streams, batch_rows, dtype)
+        nmocks[active] += batch_rows
+        converged = np.ones(len(active), dtype=bool)
+        for name, model in models.items():
+            running[name] = np.concatenate([running[name], predict_mocks(cube, model)], axis=1)
+            current = np.quantile(running[name], QUANTILES, axis=1).T
+            width = current[:, -1] - current[:, 0]
+            with np.errstate(invalid='ignore'):
+                change = np.abs(current - previous[name]).max(axis=1)
+            # NaN on the first batch, which therefore never converges
+            converged &= change <= tolerance*width
+            previous[name] = current
+        done = converged | (nmocks[active] >= max_rows)
+        for name in models:
+            for irow in np.flatnonzero(done):
+                samples[name][active[irow]] = running[name][irow]
+            running[name] = running[name][~done]
+            previous[name] = previous[name][~done]
+        active = active[~done]
+    return samples, nmocks, missing
+
+
+def mocks_note(nmocks, tolerance):
+    """Description of the achieved number of mocks for the CSV header"""
+    if not len(nmocks):
+        return 'Adaptive mocks (tolerance %g)' % tolerance
+    return 'Adaptive mocks (tolerance %g): %i to %i per galaxy, median %i' % (
+        tolerance, np.min(nmocks), np.max(nmocks), np.median(nmocks))
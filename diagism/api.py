@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Predictions without the web app, for catalogues of any size.
+
+    import diagism
+    results = diagism.predict(df, 'SFR', model='eight', sigma=0.2)
+
+or from the command line, streaming the input in chunks:
+
+    python -m diagism predict in.csv out.csv --parameter SFR
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+import pandas as pd
+
+from diagism import formats, mocks, output, parallel
+from diagism.ingest import Ingestion
+from diagism.inference import summarise
+from diagism.pipeline import Pipeline, input_values
+
+MIN_SCORE = 0.7
+CHUNK_SIZE = 1000
+
+
+class Predictor:
+    """Models and settings used to predict one or several parameters.
+
+    parameters is either the name of a parameter, or a list of names to predict
+    all of them from the same mocks, in which case the result table has the
+    columns of every parameter prefixed with its name.
+    With a tolerance, the number of mocks of each galaxy is adaptive (see
+    diagism.adaptive) and every galaxy has its own random stream.
+    dtype='float32' draws the mocks and predicts them in single precision,
+    which halves the memory; the mocks are drawn for chunk_galaxies galaxies
+    at a time, so the memory does not grow with the size of the catalogue.
+    model is 'eight', 'selected' or a model provider (see diagism.pipeline).
+    """
+
+    def __init__(self, parameters, model='eight', columns=None, sigma=0.2,
+                 seed=mocks.SEED, nrows=mocks.NROWS, min_score=MIN_SCORE,
+                 galaxy_seeds=False, tolerance=None, dtype=np.float64,
+                 chunk_galaxies=mocks.CHUNK_GALAXIES):
+        if isinstance(parameters, str):
+            parameters = [parameters]
+        # Catalogues are read once, so their stages are not memoised
+        self.pipeline = Pipeline(model, columns, sigma, seed, nrows, dtype, chunk_galaxies,
+                                 memoise=False)
+        self.model = self.pipeline.model
+        self.user_columns, self.columns = self.pipeline.user_columns, self.pipeline.columns
+        self.sigma = sigma
+        self.seed = seed
+        self.nrows = nrows
+        self.dtype = self.pipeline.dtype
+        self.tolerance = tolerance
+        self.galaxy_seeds = galaxy_seeds or tolerance is not None
+        self.sys_error = self.pipeline.sys_error
+        targets = [self.pipeline.target(param) for param in parameters]
+        bad = ['%s (%.3f)' % (target.parameter, target.score) for target in targets
+               if min_score is not None and target.score <= min_score]
+        if bad:
+            raise ValueError('The score is not good enough to make a prediction with: %s'
+                             % ', '.join(bad))
+        self.targets = [self.pipeline.add(target) for target in targets]
+        self.index = self.pipeline.index
+        # A single stream for all the chunks gives the same mocks as one call
+        if self.galaxy_seeds:
+            self.rng = mocks.GalaxyStreams(seed)
+        else:
+            self.rng = np.random.RandomState(seed)
+
+    @property
+    def description(self):
+        return self.pipeline.description
+
+    def metadata(self):
+        mocks_note = None
+        if self.tolerance is not None:
+            mocks_note = 'Adaptive mocks (tolerance %g), per galaxy in nmocks' % self.tolerance
+        return self.pipeline.metadata(mocks_note)
+
+    def header(self):
+        return self.metadata().csv_header()
+
+    def predict(self, df, first=None, rows=None):
+        """Quantile table of the next chunk of the catalogue, indexed as df.
+
+        With galaxy_seeds, first is the row of the chunk in the whole catalogue,
+        which makes the chunks independent of each other, and rows can give the
+        row of every galaxy instead, to predict galaxies of several catalogues
+        at once. Also returns the positions of the galaxies without similar
+        simulated galaxies.
+        """
+        table, missing, _ = self._predict(df, first, rows, False)
+        return table, missing
+
+    def predict_samples(self, df, first=None, rows=None):
+        """As predict, also returning the predictions of every mock of every galaxy.
+
+        They are a {parameter: (ngal, nrows) array} dict, with lists of arrays
+        instead for adaptive mocks.
+        """
+        return self._predict(df, first, rows, True)
+
+    def _predict(self, df, first, rows, samples):
+        rng = self.rng
+        if first is not None or rows is not None:
+            if not self.galaxy_seeds:
+                raise ValueError('Chunks can only be predicted out of order with galaxy_seeds')
+            rng = mocks.GalaxyStreams(self.seed, first or 0, rows)
+        values = input_values(df, self.user_columns)
+        if self.tolerance is not None:
+            if rows is not None:
+                raise ValueError('Adaptive predictions need consecutive rows')
+            return self._predict_adaptive(df, values, rng)
+        if not samples:
+            return self.pipeline.summaries(values, df.index, rng) + (None,)
+        tables, missing = [], [np.empty(0, dtype=int)]
+        predictions = {target.parameter: [np.empty((0, self.nrows), dtype=self.dtype)]
+                       for target in self.targets}
+        for table, chunk_missing, chunk_predictions in self.pipeline.chunk_results(
+                values, df.index, rng):
+            tables.append(table)
+            missing.append(chunk_missing)
+            for param, pred in chunk_predictions.items():
+                predictions[param].append(pred)
+        if not tables:
+            tables.append(self.pipeline.summaries(values, df.index, rng)[0])
+        return (pd.concat(tables), np.concatenate(missing),
+                {param: np.concatenate(preds) for param, preds in predictions.items()})
+
+    def _predict_adaptive(self, df, values, rng):
+        samples, nmocks, missing = self.pipeline.adaptive(values, self.tolerance, rng.first)
+        # Consecutive calls continue with the following galaxies
+        rng.first += len(values)
+        results = {param: summarise(samples[param], index=df.index) for param in samples}
+        table = output.wide_table(results)
+        table['nmocks'] = nmocks
+        return table, missing, samples
+
+
+def predict(df, parameter, model='eight', sigma=0.2, workers=1, **kwargs):
+    """Predict physical parameters for every galaxy (row) of a catalogue.
+
+    df has the columns described in the CSV information page; parameter is one
+    of 'SFR', 'ISRF', 'Metallicity', 'Pressure', 'Density', 'Neutral cloud size',
+    'Gas Mass' and 'Stellar Mass', or a list of them; model is 'eight' for the
+    eight FIR lines model or 'selected' for the model trained with the columns
+    of df. Returns the per_16th, median, per_84th, mean and std of the
+    predictions of each galaxy, prefixed with the parameter name when there
+    are several parameters.
+    Every galaxy draws its mocks from its own random stream, so the results do
+    not depend on the number of workers that split the galaxies over several
+    processes. galaxy_seeds=False uses the single stream of the web app pages,
+    with one worker only.
+    """
+    kwargs.setdefault('galaxy_seeds', True)
+    predictor = Predictor(parameter, model, list(df.columns), sigma, **kwargs)
+    if workers > 1:
+        return parallel.predict_parallel(predictor, df, workers)[0]
+    return predictor.predict(df)[0]
+
+
+def predict_csv(input_file, output_file, parameter, model='eight', sigma=0.2,
+                chunksize=CHUNK_SIZE, log=None, workers=1, fmt=None, samples=False, **kwargs):
+    """Predict a CSV catalogue into a results file, chunk by chunk.
+
+    The rows that cannot be read are skipped and reported through log. With
+    more than one worker the chunks are predicted in parallel. As in predict,
+    every galaxy has its own random stream unless galaxy_seeds=False. fmt is one of
+    formats.FORMATS, by default the one of the extension of output_file, and
+    samples also saves the prediction of every mock (Parquet and FITS only).
+    """
+    ingestion = Ingestion(input_file, chunksize)
+    chunks = iter(ingestion)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError('No valid galaxies in %s' % input_file)
+    kwargs.setdefault('galaxy_seeds', True)
+    predictor = Predictor(parameter, model, list(first.columns), sigma, **kwargs)
+    if workers > 1:
+        results = parallel.predict_chunks(predictor, _chain(first, chunks), workers, samples)
+    elif samples:
+        results = (predictor.predict_samples(chunk) for chunk in _chain(first, chunks))
+    else:
+        results = (predictor.predict(chunk) for chunk in _chain(first, chunks))
+    ngal = 0
+    fmt = fmt or formats.format_of(output_file)
+    with open(output_file, 'wb') as file, formats.open_writer(
+            file, fmt, predictor.metadata(), samples) as writer:
+        for result, missing, *chunk_samples in results:
+            writer.write(result, *chunk_samples)
+            ngal += len(result)
+            if log is not None:
+                log('%i galaxies done, %i without similar simulated galaxies'
+                    % (ngal, len(missing)))
+    if log is not None and ingestion.nrejected:
+        log('%i rows rejected' % ingestion.nrejected)
+        for error in ingestion.errors:
+            log('line %i: %s%s' % (error.line, error.reason, '' if error.column is None
+                                   else ' (%s = %r)' % (error.column, error.value)))
+    return ngal
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputed scalers and scores of the models.
+
+The RobustScaler of the luminosities is fitted once on all the feature columns;
+as it works column by column, the scaler of any subset of lines is a slice of
+it. The scores of the eight FIR lines models never change for a given dataset
+and list of models, so they are computed when building the artifacts.
+Build the file with python -m diagism build-artifacts
+@author: Andres Felipe Ramos Padilla
+"""
+import os
+
+import numpy as np
+
+from diagism.columns import COL_ANALT, DICT_PAR
+from diagism.resources import (FILES_DIR, DATASET_FILE, MODELS_FILE, cached, file_digest,
+                               feature_matrix, target_vector, model_index, load_models)
+
+ARTIFACTS_FILE = os.path.join(FILES_DIR, 'scalers_scores.npz')
+
+
+def fitted_scaler(center, scale):
+    """RobustScaler with already known center and scale"""
+    from sklearn import preprocessing
+    scaler = preprocessing.RobustScaler()
+    scaler.center_ = np.array(center, dtype=np.float64)
+    scaler.scale_ = np.array(scale, dtype=np.float64)
+    scaler.n_features_in_ = len(scaler.center_)
+    return scaler
+
+
+def _digests():
+    return file_digest(DATASET_FILE), file_digest(MODELS_FILE)
+
+
+def compute_artifacts():
+    """Scalers of all the columns and parameters, and scores of the eight lines models"""
+    from sklearn import preprocessing
+    x_values = feature_matrix(COL_ANALT)
+    scalerx = preprocessing.RobustScaler().fit(x_values)
+    x_scale = scalerx.transform(x_values)
+    models = load_models()
+    parameters = list(DICT_PAR.values())
+    y_center, y_scale, score = [], [], []
+    for param in parameters:
+        y_values = target_vector(param)
+        scalery = preprocessing.RobustScaler().fit(y_values)
+        y_center.append(scalery.center_[0])
+        y_scale.append(scalery.scale_[0])
+        score.append(models[model_index(param)].score(x_scale, scalery.transform(y_values)))
+    dataset_digest, models_digest = _digests()
+    return {'columns': np.array(COL_ANALT), 'x_center': scalerx.center_,
+            'x_scale': scalerx.scale_, 'parameters': np.array(parameters),
+            'y_center': np.array(y_center), 'y_scale': np.array(y_scale),
+            'score': np.array(score), 'dataset_digest': np.array(dataset_digest),
+            'models_digest': np.array(models_digest)}
+
+
+def build_artifacts(path=ARTIFACTS_FILE):
+    """Compute the artifacts and save them to path"""
+    np.savez(path, **compute_artifacts())
+    return path
+
+
+def _read_artifacts(path):
+    with np.load(path) as data:
+        return dict(data)
+
+
+def load_artifacts(path=ARTIFACTS_FILE):
+    """Saved artifacts, computed once per process if the file is missing or stale"""
+    digests = _digests()
+    if os.path.exists(path):
+        artifacts = cached(path, 'artifacts', lambda: _read_artifacts(path))
+        if (str(artifacts['dataset_digest']), str(artifacts['models_digest'])) == digests:
+            return artifacts
+    return cached(MODELS_FILE, ('artifacts', digests), compute_artifacts)
+
+
+def x_scaling(columns):
+    """Center and scale of the RobustScaler of the given feature columns"""
+    artifacts = load_artifacts()
+    loc_cols = [list(artifacts['columns']).index(col) for col in columns]
+    return artifacts['x_center'][loc_cols], artifacts['x_scale'][loc_cols]
+
+
+def _parameter_row(artifacts, parameter):
+    return list(artifacts['parameters']).index(parameter)
+
+
+def y_scaling(parameter):
+    """Center and scale of the RobustScaler of a physical parameter"""
+    artifacts = load_artifacts()
+    row = _parameter_row(artifacts, parameter)
+    return artifacts['y_center'][row:row+1], artifacts['y_scale'][row:row+1]
+
+
+def x_scaler(columns):
+    """Fitted RobustScaler of the given feature columns"""
+    return fitted_scaler(*x_scaling(columns))
+
+
+def y_scaler(parameter):
+    """Fitted RobustScaler of a physical parameter"""
+    return fitted_scaler(*y_scaling(parameter))
+
+
+def eight_lines_score(parameter):
+    """Score (R^2) of the eight FIR lines model of a physical parameter"""
+    artifacts = load_artifacts()
+    return float(artifacts['score'][_parameter_row(artifacts, parameter)])
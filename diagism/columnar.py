@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Column-oriented copy of the simulation dataset, read with memory maps.
+
+Decoding the FITS table is the slowest part of a cold start. After a one-time
+conversion (python -m diagism convert-dataset), every column is a .npy file
+that is memory-mapped on demand, so only the columns in use are read, without
+copies, and the pages are shared by all the sessions and worker processes.
+The eight FIR lines and log(1+z) are also saved as one Fortran-ordered block,
+the layout used by the neighbour search and the scalers.
+The manifest records the SHA-256 of the FITS file, and a store converted from
+another version of the dataset is ignored.
+@author: Andres Felipe Ramos Padilla
+"""
+import json
+import os
+
+import numpy as np
+
+from diagism.columns import COL_ANALT
+
+MANIFEST = 'manifest.json'
+FEATURES = 'features.npy'
+
+
+def _column_file(icol):
+    return 'column_%03i.npy' % icol
+
+
+def convert(source, directory, digest):
+    """Write the columns of a FITS dataset to directory.
+
+    digest is the SHA-256 of source, stored in the manifest.
+    """
+    from astropy.table import Table
+    # diagism.resources imports this module
+    from diagism.resources import atomic_write
+    dataset = Table.read(source, format='fits')
+    dataset['log(1+z)'] = np.log10(dataset['z']+1)
+    os.makedirs(directory, exist_ok=True)
+    columns = {}
+    for icol, name in enumerate(dataset.colnames):
+        column = dataset[name]
+        # Numbers are saved as float64 and masked values as NaN, the other
+        # columns (the name of the simulation) keep their own dtype
+        numeric = column.dtype.kind in 'biuf'
+        if hasattr(column, 'filled'):
+            column = column.filled(np.nan) if numeric else column.filled()
+        values = np.asarray(column, dtype=np.float64 if numeric else None)
+        np.save(os.path.join(directory, _column_file(icol)), values)
+        unit = dataset[name].unit
+        columns[name] = {'file': _column_file(icol), 'dtype': values.dtype.str,
+                         'unit': None if unit is None else str(unit)}
+    features = np.empty((len(dataset), len(COL_ANALT)), order='F')
+    for icol, name in enumerate(COL_ANALT):
+        features[:, icol] = np.load(os.path.join(directory, columns[name]['file']))
+    np.save(os.path.join(directory, FEATURES), features)
+    manifest = {'source': os.path.basename(source), 'sha256': digest,
+                'nrows': len(dataset), 'columns': columns,
+                'features': {'file': FEATURES, 'columns': list(COL_ANALT)}}
+    # The manifest is written last, so a store is only used once complete
+    atomic_write(os.path.join(directory, MANIFEST),
+                 lambda file: json.dump(manifest, file, indent=1), 'w')
+    return directory
+
+
+class ColumnStore:
+    """Memory-mapped columns of a converted dataset"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST)) as file:
+            self.manifest = json.load(file)
+        self.nrows = self.manifest['nrows']
+
+    def __contains__(self, name):
+        return name in self.manifest['columns']
+
+    def _load(self, file):
+        return np.load(os.path.join(self.directory, file), mmap_mode='r')
+
+    def column(self, name):
+        """Read-only memory map of a column, float64 for the numeric ones"""
+        return self._load(self.manifest['columns'][name]['file'])
+
+    def unit(self, name):
+        """Unit of a column as a string, or None"""
+        return self.manifest['columns'][name]['unit']
+
+    def features(self, columns):
+        """Read-only (nsim, ncolumns) Fortran-ordered array of the given columns.
+
+        The block of all the feature columns is returned without copies.
+        """
+        columns = list(columns)
+        if columns == self.manifest['features']['columns']:
+            return self._load(self.manifest['features']['file'])
+        matrix = np.empty((self.nrows, len(columns)), order='F')
+        for icol, name in enumerate(columns):
+            matrix[:, icol] = self.column(name)
+        matrix.flags.writeable = False
+        return matrix
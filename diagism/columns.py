@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Column names of the user input and of the simulation dataset.
+@author: Andres Felipe Ramos Padilla
+"""
+# User column name -> simulation column name, in the order used by the models
+DICT_CONV = {'Lum_OIII_52': 'L$_{\\mathrm{OIII_{52}}}$',
+             'Lum_NIII_57': 'L$_{\\mathrm{NIII_{57}}}$',
+             'Lum_OI_63': 'L$_{\\mathrm{OI_{63}}}$',
+             'Lum_OIII_88': 'L$_{\\mathrm{OIII_{88}}}$',
+             'Lum_NII_122': 'L$_{\\mathrm{NII_{122}}}$',
+             'Lum_OI_145': 'L$_{\\mathrm{OI_{145}}}$',
+             'Lum_CII_158': 'L$_{\\mathrm{CII}}$',
+             'Lum_NII_205': 'L$_{\\mathrm{NII_{205}}}$',
+             'z': 'log(1+z)'}
+
+COL_ANALT = list(DICT_CONV.values())
+
+# Physical parameter -> simulation column name
+DICT_PAR = {'SFR': 'SFR',
+            'ISRF': 'ISRF',
+            'Metallicity': 'ZGal',
+            'Pressure': 'Pressure',
+            'Density': r'n$(\mathrm{H})_{\mathrm{cloud}}$',
+            'Stellar Mass': r'M$_{\mathrm{\ast}}$',
+            'Gas Mass': r'M$_{\mathrm{gas}}$',
+            'Neutral cloud size': r'R$_{\mathrm{cloud}}$'}
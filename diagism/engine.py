@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NumPy forward pass of the trained MLPRegressor models.
+
+The weights of the eight FIR lines models are exported once to a .npz file
+(python -m diagism export-engine), so the pages neither unpickle nor import
+scikit-learn to predict. The RobustScaler of the inputs is folded into the
+first layer and the one of the parameter into the last layer, which leaves a
+chain of matrix products and activations.
+@author: Andres Felipe Ramos Padilla
+"""
+import os
+
+import numpy as np
+
+from diagism.artifacts import x_scaling, y_scaling
+from diagism.columns import COL_ANALT
+from diagism.resources import (FILES_DIR, MODELS_FILE, cached, file_digest,
+                               load_hyperparameters, load_models, model_index)
+
+ENGINE_FILE = os.path.join(FILES_DIR, 'AllLines_trained.npz')
+
+
+def _identity(x):
+    return x
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _tanh(x):
+    return np.tanh(x, out=x)
+
+
+def _logistic(x):
+    # 1/(1+exp(-x)) in place, as scipy.special.expit
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+
+ACTIVATIONS = {'identity': _identity, 'relu': _relu, 'tanh': _tanh, 'logistic': _logistic}
+
+
+class NumpyMLP:
+    """Forward pass of a regression MLP with identity output"""
+
+    def __init__(self, coefs, intercepts, activation, dtype=np.float64):
+        if activation not in ACTIVATIONS:
+            raise ValueError('Unknown activation %r' % activation)
+        self.dtype = np.dtype(dtype)
+        self.coefs = [np.ascontiguousarray(coef, dtype=self.dtype) for coef in coefs]
+        self.intercepts = [np.asarray(inter, dtype=self.dtype) for inter in intercepts]
+        self.activation = activation
+
+    @classmethod
+    def fused(cls, coefs, intercepts, activation, x_center, x_scale, y_center, y_scale,
+              dtype=np.float64):
+        """Model predicting in physical units, with both scalers folded in.
+
+        (x - c)/s @ W + b is x @ (W/s) + (b - c/s @ W) for the first layer, and
+        the inverse scaling y*s + c of the output multiplies the last layer.
+        """
+        coefs = [np.asarray(coef, dtype=np.float64) for coef in coefs]
+        intercepts = [np.asarray(inter, dtype=np.float64) for inter in intercepts]
+        x_center, x_scale = np.asarray(x_center, float), np.asarray(x_scale, float)
+        y_center, y_scale = np.asarray(y_center, float), np.asarray(y_scale, float)
+        intercepts[0] = intercepts[0] - (x_center/x_scale) @ coefs[0]
+        coefs[0] = coefs[0] / x_scale[:, None]
+        coefs[-1] = coefs[-1] * y_scale
+        intercepts[-1] = intercepts[-1]*y_scale + y_center
+        return cls(coefs, intercepts, activation, dtype)
+
+    def astype(self, dtype):
+        """The same model computing in another precision"""
+        if np.dtype(dtype) == self.dtype:
+            return self
+        return type(self)(self.coefs, self.intercepts, self.activation, dtype)
+
+    def predict(self, X):
+        """Output of the model for an (nsamples, nfeatures) array, as a 1D array"""
+        hidden = ACTIVATIONS[self.activation]
+        activation = np.asarray(X, dtype=self.dtype)
+        last = len(self.coefs) - 1
+        for ilayer, (coef, intercept) in enumerate(zip(self.coefs, self.intercepts)):
+            activation = activation @ coef
+            activation += intercept
+            if ilayer != last:
+                hidden(activation)
+        return activation.ravel()
+
+
+def fuse_model(regr_mlp, columns, column):
+    """NumpyMLP of a fitted MLPRegressor with the scalers of its columns and parameter"""
+    if regr_mlp.out_activation_ != 'identity':
+        raise ValueError('Only regression models with identity output can be fused')
+    return NumpyMLP.fused(regr_mlp.coefs_, regr_mlp.intercepts_, regr_mlp.activation,
+                          *x_scaling(columns), *y_scaling(column))
+
+
+def export_models(path=ENGINE_FILE, dtype=np.float64):
+    """Save the weights of the eight FIR lines models to a .npz file"""
+    models = load_models()
+    arrays = {'parameters': np.array(list(load_hyperparameters()['Parameter']), dtype=str),
+              'activations': np.array([regr.activation for regr in models], dtype=str),
+              'nlayers': np.array([len(regr.coefs_) for regr in models]),
+              'models_digest': np.array(file_digest(MODELS_FILE))}
+    for imodel, regr in enumerate(models):
+        if regr.out_activation_ != 'identity':
+            raise ValueError('Model %i is not a regression with identity output' % imodel)
+        for ilayer, (coef, inter) in enumerate(zip(regr.coefs_, regr.intercepts_)):
+            arrays['coef_%i_%i' % (imodel, ilayer)] = np.asarray(coef, dtype=dtype)
+            arrays['intercept_%i_%i' % (imodel, ilayer)] = np.asarray(inter, dtype=dtype)
+    with open(path, 'wb') as file:
+        np.savez(file, **arrays)
+    return path
+
+
+def _read_engine(path):
+    with np.load(path) as npz:
+        return {key: npz[key] for key in npz.files}
+
+
+def _exported_layers(column, path):
+    """Weights and activation of a model from the exported file, or None if stale"""
+    weights = cached(path, 'weights', lambda: _read_engine(path))
+    if str(weights['models_digest']) != file_digest(MODELS_FILE):
+        return None
+    imodel = list(weights['parameters']).index(column)
+    nlayers = int(weights['nlayers'][imodel])
+    return ([weights['coef_%i_%i' % (imodel, ilayer)] for ilayer in range(nlayers)],
+            [weights['intercept_%i_%i' % (imodel, ilayer)] for ilayer in range(nlayers)],
+            str(weights['activations'][imodel]),
+            weights['coef_%i_0' % imodel].dtype)
+
+
+def eight_lines_engine(column, path=ENGINE_FILE):
+    """Fused NumpyMLP of the eight FIR lines model of a parameter.
+
+    Reads the exported weights when they are up to date with the pickled
+    models, and the pickled models otherwise.
+    """
+    def build_exported():
+        layers = _exported_layers(column, path)
+        if layers is None:
+            return None
+        coefs, intercepts, activation, dtype = layers
+        return NumpyMLP.fused(coefs, intercepts, activation, *x_scaling(COL_ANALT),
+                              *y_scaling(column), dtype=dtype)
+
+    if os.path.exists(path):
+        engine = cached(path, ('engine', column), build_exported)
+        if engine is not None:
+            return engine
+    return cached(MODELS_FILE, ('engine', column),
+                  lambda: fuse_model(load_models()[model_index(column)], COL_ANALT, column))
+
+
+def compare_sklearn(column, engine=None, nsamples=10000, seed=0):
+    """Largest absolute difference with the scikit-learn pipeline for a parameter.
+
+    The inputs are rows of the simulation dataset, perturbed as the mocks are.
+    """
+    from diagism.artifacts import x_scaler, y_scaler
+    from diagism.inference import ScaledRegressor
+    from diagism.resources import feature_matrix
+    engine = engine or eight_lines_engine(column)
+    features = feature_matrix(COL_ANALT)
+    rng = np.random.default_rng(seed)
+    X = features[rng.integers(len(features), size=nsamples)]
+    X = X + rng.normal(0, 0.2, X.shape)
+    reference = ScaledRegressor(x_scaler(COL_ANALT), load_models()[model_index(column)],
+                                y_scaler(column)).predict(X)
+    return float(np.max(np.abs(engine.predict(X) - reference)))
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Files of results in CSV, gzip compressed CSV, Parquet and FITS.
+
+    with open_writer(file, 'fits', metadata, samples=True) as writer:
+        for table, missing, samples in chunks:
+            writer.write(table, samples)
+
+The writers are fed chunk by chunk, as the predictions finish, so the whole
+file is never held in memory. The description of the run (Metadata) is the
+commented header of the CSV files, the key-value metadata of the Parquet
+schema (and the unit of every column), and the header keywords of the FITS
+table (with TUNIT). Parquet and FITS files can also keep the prediction of
+every mock of every galaxy, one array per parameter and galaxy. Parquet needs
+pyarrow, which is optional.
+@author: Andres Felipe Ramos Padilla
+"""
+import gzip
+import importlib.util
+import io
+import json
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+from diagism import output
+
+# Format: (file extension, MIME type)
+FORMATS = {'csv': ('.csv', 'text/csv'),
+           'csv.gz': ('.csv.gz', 'application/gzip'),
+           'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+           'fits': ('.fits', 'application/fits')}
+EXTENSIONS = {'.pq': 'parquet', '.fit': 'fits', '.fts': 'fits'}
+SAMPLE_FORMATS = ('parquet', 'fits')
+CHUNK_ROWS = 10000
+ID_WIDTH = 64
+
+
+class Metadata(namedtuple('Metadata', ['parameters', 'units', 'scores', 'model', 'mocks',
+                                       'timings'], defaults=(None, None))):
+    """Description of a run, as given to output.csv_header"""
+
+    def csv_header(self):
+        return output.csv_header(self.parameters, self.units, self.scores, self.model,
+                                 self.mocks, self.timings)
+
+    def as_dict(self):
+        return {'creator': 'DiagISM',
+                'date': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                'parameters': list(self.parameters), 'units': [str(unit) for unit in self.units],
+                'scores': [float(score) for score in self.scores], 'model': self.model,
+                'mocks': self.mocks, 'stages': self.timings}
+
+    def column_units(self, columns):
+        """Unit of every column of a result table, '' for the others"""
+        if len(self.parameters) == 1:
+            return ['' if col == 'nmocks' else str(self.units[0]) for col in columns]
+        units = []
+        for col in columns:
+            unit = ''
+            for param, param_unit in zip(self.parameters, self.units):
+                if col.startswith(output.column_prefix(param)):
+                    unit = str(param_unit)
+            units.append(unit)
+        return units
+
+    def samples_column(self, parameter):
+        """Name of the column with the predictions of every mock of a parameter"""
+        if len(self.parameters) == 1:
+            return 'samples'
+        return output.column_prefix(parameter) + 'samples'
+
+
+def available_formats():
+    """Formats that can be written with the installed packages"""
+    return [fmt for fmt in FORMATS
+            if fmt != 'parquet' or importlib.util.find_spec('pyarrow') is not None]
+
+
+def format_of(path):
+    """Format of a file name, from its extension (CSV by default)"""
+    path = str(path).lower()
+    extensions = dict(EXTENSIONS, **{extension: fmt for fmt, (extension, _) in FORMATS.items()})
+    for extension, fmt in extensions.items():
+        if path.endswith(extension):
+            return fmt
+    return 'csv'
+
+
+class _Writer:
+    def __init__(self, file, metadata, samples=False):
+        self.file = file
+        self.metadata = metadata
+        self.samples = samples
+        self.nrows = 0
+
+    def write(self, table, samples=None):
+        """Append the rows of a result table.
+
+        samples are the predictions of every mock of the rows, as a {parameter:
+        (ngal, nmocks) array, or list of arrays for adaptive mocks} dict.
+        """
+        if self.samples and samples is None:
+            raise ValueError('The predictions of the mocks are needed to write the samples')
+        self._write(table, samples)
+        self.nrows += len(table)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVWriter(_Writer):
+    """CSV file with the commented header of the web app, optionally gzip compressed"""
+
+    def __init__(self, file, metadata, samples=False, compress=False):
+        if samples:
+            raise ValueError('The samples can only be saved as %s' % ' or '.join(SAMPLE_FORMATS))
+        super().__init__(file, metadata)
+        self.compress = compress
+        if compress:
+            # mtime=0 gives the same file for the same results
+            self.file = gzip.GzipFile(fileobj=file, mode='wb', mtime=0)
+        self.file.write(metadata.csv_header())
+
+    def _write(self, table, samples):
+        self.file.write(output.csv_rows(table, header=self.nrows == 0))
+
+    def close(self):
+        if self.compress:
+            # Only flushes the compressed stream, the underlying file stays open
+            self.file.close()
+
+
+def _samples_array(pa, predictions):
+    if isinstance(predictions, np.ndarray):
+        flat = pa.array(np.ascontiguousarray(predictions).ravel())
+        return pa.FixedSizeListArray.from_arrays(flat, predictions.shape[1])
+    # Adaptive mocks, a different number for every galaxy
+    return pa.array([np.asarray(pred) for pred in predictions])
+
+
+class ParquetWriter(_Writer):
+    """Parquet file, with one row group per chunk"""
+
+    def __init__(self, file, metadata, samples=False):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('Parquet files need pyarrow (pip install pyarrow)')
+        super().__init__(file, metadata, samples)
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self._writer = None
+        self._schema = None
+
+    def _write(self, table, samples):
+        pa = self.pa
+        batch = pa.Table.from_pandas(table.rename_axis('id').reset_index(), preserve_index=False)
+        if self.samples:
+            for param in self.metadata.parameters:
+                batch = batch.append_column(self.metadata.samples_column(param),
+                                            _samples_array(pa, samples[param]))
+        if self._writer is None:
+            units = dict(zip(table.columns, self.metadata.column_units(table.columns)))
+            for param in self.metadata.parameters if self.samples else []:
+                units[self.metadata.samples_column(param)] = str(
+                    self.metadata.units[self.metadata.parameters.index(param)])
+            fields = [field.with_metadata({b'unit': units[field.name].encode()})
+                      if units.get(field.name) else field for field in batch.schema]
+            schema_metadata = dict(batch.schema.metadata or {})
+            schema_metadata[b'diagism'] = json.dumps(self.metadata.as_dict()).encode()
+            self._schema = pa.schema(fields, metadata=schema_metadata)
+            self._writer = self.pq.ParquetWriter(self.file, self._schema)
+        self._writer.write_table(batch.cast(self._schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class FITSWriter(_Writer):
+    """FITS file with the results in a binary table extension.
+
+    The rows are streamed after the header of the table, whose number of rows
+    is updated by close(), so the file must be seekable.
+    """
+
+    def __init__(self, file, metadata, samples=False):
+        from astropy.io import fits
+        super().__init__(file, metadata, samples)
+        self.fits = fits
+        self._header = None
+        self._header_start = None
+        self._dtype = None
+
+    def _start(self, table, samples):
+        fits = self.fits
+        integer_ids = np.issubdtype(table.index.dtype, np.integer)
+        names = ['id'] + list(table.columns)
+        formats = ['K' if integer_ids else '%iA' % ID_WIDTH]
+        dtypes = [('id', '>i8' if integer_ids else 'S%i' % ID_WIDTH)]
+        for col in table.columns:
+            integer = np.issubdtype(table[col].dtype, np.integer)
+            formats.append('K' if integer else 'D')
+            dtypes.append((col, '>i8' if integer else '>f8'))
+        units = [''] + self.metadata.column_units(table.columns)
+        if self.samples:
+            for param in self.metadata.parameters:
+                predictions = samples[param]
+                if not isinstance(predictions, np.ndarray):
+                    raise ValueError('FITS samples need the same number of mocks for every '
+                                     'galaxy, use Parquet for adaptive mocks')
+                single = predictions.dtype == np.float32
+                names.append(self.metadata.samples_column(param))
+                formats.append('%i%s' % (predictions.shape[1], 'E' if single else 'D'))
+                dtypes.append((names[-1], '>f4' if single else '>f8', (predictions.shape[1],)))
+                units.append(str(self.metadata.units[self.metadata.parameters.index(param)]))
+        columns = [fits.Column(name=name, format=fmt, unit=unit or None)
+                   for name, fmt, unit in zip(names, formats, units)]
+        hdu = fits.BinTableHDU.from_columns(columns, nrows=0)
+        info = self.metadata.as_dict()
+        header = hdu.header
+        header['EXTNAME'] = 'DIAGISM'
+        header['CREATOR'] = info['creator']
+        header['DATE'] = info['date']
+        header['MODEL'] = info['model']
+        header['NPARAM'] = len(info['parameters'])
+        for iparam, (param, unit, score) in enumerate(zip(info['parameters'], info['units'],
+                                                          info['scores']), 1):
+            header['PARAM%i' % iparam] = param
+            header['UNIT%i' % iparam] = unit
+            header['SCORE%i' % iparam] = (score, 'R^2 of the predictions')
+        if info['mocks']:
+            header['MOCKS'] = info['mocks']
+        if info['stages']:
+            header['STAGES'] = info['stages']
+        self._dtype = np.dtype(dtypes)
+        self._header = header
+        self.file.write(fits.PrimaryHDU().header.tostring().encode('ascii'))
+        self._header_start = self.file.tell()
+        self.file.write(header.tostring().encode('ascii'))
+
+    def _write(self, table, samples):
+        if self._header is None:
+            self._start(table, samples)
+        rows = np.empty(len(table), dtype=self._dtype)
+        ids = np.asarray(table.index)
+        rows['id'] = ids if self._dtype['id'].kind == 'i' else [
+            str(idx).encode('ascii', 'replace')[:ID_WIDTH] for idx in ids]
+        for col in table.columns:
+            rows[col] = table[col].to_numpy()
+        if self.samples:
+            for param in self.metadata.parameters:
+                rows[self.metadata.samples_column(param)] = samples[param]
+        self.file.write(rows.tobytes())
+
+    def close(self):
+        if self._header is None:
+            return
+        # The data ends with zeros up to a multiple of 2880 bytes
+        self.file.write(b'\0' * (-self.nrows*self._dtype.itemsize % 2880))
+        end = self.file.tell()
+        self._header['NAXIS2'] = self.nrows
+        self.file.seek(self._header_start)
+        self.file.write(self._header.tostring().encode('ascii'))
+        self.file.seek(end)
+
+
+def open_writer(file, fmt, metadata, samples=False):
+    """Writer of results in a format of FORMATS to a binary file object"""
+    if fmt in ('csv', 'csv.gz'):
+        return CSVWriter(file, metadata, samples, compress=fmt == 'csv.gz')
+    if fmt == 'parquet':
+        return ParquetWriter(file, metadata, samples)
+    if fmt == 'fits':
+        return FITSWriter(file, metadata, samples)
+    raise ValueError('Unknown format %r, use one of %s' % (fmt, list(FORMATS)))
+
+
+def encode(fmt, table, metadata, samples=None, chunk_rows=CHUNK_ROWS):
+    """File contents of a whole result table, written chunk_rows rows at a time"""
+    buffer = io.BytesIO()
+    with open_writer(buffer, fmt, metadata, samples is not None) as writer:
+        for start in range(0, max(len(table), 1), chunk_rows):
+            part = None if samples is None else {
+                param: pred[start:start+chunk_rows] for param, pred in samples.items()}
+            writer.write(table.iloc[start:start+chunk_rows], part)
+    return buffer.getvalue()
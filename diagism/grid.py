@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputed quantile grids for the single galaxy of the sidebar.
+
+The sidebar only gives integer redshifts and luminosities between 3 and 11, so
+the quantile table of a combination of lines can be computed offline on a
+grid of luminosities (python -m diagism build-grid) and interpolated
+multilinearly, which answers in milliseconds instead of running the Monte Carlo.
+Every node is predicted as a single galaxy with a fresh RandomState(SEED), as
+the pages do, so on the nodes the grid gives the results of the full
+computation. Between the nodes the interpolation has an error, measured when
+the grid is built on CHECK_POINTS inputs midway between luminosity nodes, kept
+in the manifest and reported with the results.
+Grids are memory-mapped from files/grids/<name>/ and only used for
+the model, lines, sigma and data files they were built with. Off-grid inputs,
+nodes without similar simulated galaxies and uploaded catalogues fall back to
+the Monte Carlo.
+@author: Andres Felipe Ramos Padilla
+"""
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from diagism import mocks
+from diagism.columns import DICT_CONV, DICT_PAR
+from diagism.inference import predict_mocks, summarise
+from diagism.resources import (DATASET_FILE, FILES_DIR, HYPERPARAMETERS_FILE, MODELS_FILE,
+                               atomic_write, cached, file_digest)
+
+GRIDS_DIR = os.path.join(FILES_DIR, 'grids')
+MANIFEST = 'manifest.json'
+LUMINOSITY_RANGE = (3.0, 11.0)
+REDSHIFTS = np.arange(7)
+STEP = 0.5
+STATS = ('per_16th', 'median', 'per_84th', 'mean', 'std')
+CHUNK_NODES = 500
+# Inputs between the nodes used to measure the interpolation error
+CHECK_POINTS = 100
+
+
+def grid_name(model, columns, sigma):
+    """Directory name of the grid of a model, user columns and sigma"""
+    return '%s-%s-sigma%.2f' % (model, '_'.join(columns), sigma)
+
+
+def axis_nodes(column, step=STEP):
+    """Values of the grid nodes of a user column"""
+    if column == 'z':
+        # The sidebar gives log(1+z) of integer redshifts
+        return np.log10(1 + REDSHIFTS)
+    low, high = LUMINOSITY_RANGE
+    return np.round(np.linspace(low, high, int(round((high-low)/step)) + 1), 6)
+
+
+def _data_digests():
+    return [file_digest(path) for path in (DATASET_FILE, MODELS_FILE, HYPERPARAMETERS_FILE)]
+
+
+class _SameSeed(mocks.GalaxyStreams):
+    """Random stream giving every galaxy the normals of a fresh RandomState(seed).
+
+    Each node then gets the mocks it would get as a single galaxy request.
+    """
+
+    def standard_normal(self, counts):
+        return np.concatenate([np.random.RandomState(self.seed).standard_normal(count)
+                               for count in counts] or [np.empty(0)])
+
+
+def _compute_nodes(predictor, columns, points, log=None):
+    """(npoints, nparameters, nstats) statistics of single galaxy requests at points.
+
+    Also returns which points had no similar simulated galaxies.
+    """
+    table = np.empty((len(points), len(predictor.targets), len(STATS)))
+    missing = np.zeros(len(points), dtype=bool)
+    values = np.full((len(points), len(predictor.user_columns)), np.nan)
+    for icol, col in enumerate(columns):
+        values[:, predictor.user_columns.index(col)] = points[:, icol]
+    for start in range(0, len(points), CHUNK_NODES):
+        part = values[start:start+CHUNK_NODES]
+        faked, chunk_missing = mocks.create_mocks(
+            part, predictor.index, predictor.sigma, predictor.sys_error,
+            nrows=predictor.nrows, rng=_SameSeed(predictor.seed))
+        missing[start + chunk_missing] = True
+        for iparam, target in enumerate(predictor.targets):
+            stats = summarise(predict_mocks(faked, target.engine))
+            table[start:start+len(part), iparam] = stats[list(STATS)].to_numpy()
+        if log is not None:
+            log('%i of %i nodes done' % (min(start+CHUNK_NODES, len(points)), len(points)))
+    return table, missing
+
+
+def check_points(columns, axes, npoints=CHECK_POINTS, seed=0):
+    """Inputs midway between the luminosity nodes of random cells, on redshift nodes"""
+    rng = np.random.default_rng(seed)
+    points = np.empty((npoints, len(axes)))
+    for icol, (col, axis) in enumerate(zip(columns, axes)):
+        if col == 'z':
+            points[:, icol] = axis[rng.integers(0, len(axis), npoints)]
+        else:
+            inode = rng.integers(0, len(axis) - 1, npoints)
+            points[:, icol] = (axis[inode] + axis[inode+1]) / 2
+    return points
+
+
+def interpolation_error(predictor, columns, axes, table, missing, parameters):
+    """{parameter: {statistic: max |error|}} of the grid on check_points"""
+    points = check_points(columns, axes)
+    exact, exact_missing = _compute_nodes(predictor, columns, points)
+    errors = np.zeros((len(parameters), len(STATS)))
+    for point, stats, point_missing in zip(points, exact, exact_missing):
+        interpolated = interpolate(axes, table, missing, point)
+        if interpolated is not None and not point_missing:
+            errors = np.maximum(errors, np.abs(interpolated - stats))
+    return {param: dict(zip(STATS, errors[iparam].tolist()))
+            for iparam, param in enumerate(parameters)}
+
+
+def build_grid(model, columns, parameters=None, sigma=0.2, step=STEP, directory=GRIDS_DIR,
+               log=None):
+    """Compute the quantile grid of a model and user columns, for all the parameters.
+
+    Returns the directory of the grid.
+    """
+    from diagism.api import Predictor
+    parameters = parameters or list(DICT_PAR)
+    columns = [col for col in DICT_CONV if col in columns]
+    predictor = Predictor(parameters, model, columns, sigma, min_score=None)
+    axes = [axis_nodes(col, step) for col in columns]
+    shape = tuple(len(axis) for axis in axes)
+    nodes = np.array(list(itertools.product(*axes)))
+    table, missing = _compute_nodes(predictor, columns, nodes, log)
+    table = table.reshape(shape + table.shape[1:])
+    missing = missing.reshape(shape)
+    errors = interpolation_error(predictor, columns, axes, table, missing, parameters)
+
+    path = os.path.join(directory, grid_name(model, columns, sigma))
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'table.npy'), table)
+    np.save(os.path.join(path, 'missing.npy'), missing)
+    manifest = {'model': model, 'columns': columns, 'parameters': parameters,
+                'units': [str(target.unit) for target in predictor.targets],
+                'scores': [float(target.score) for target in predictor.targets],
+                'sigma': sigma, 'seed': predictor.seed, 'nrows': predictor.nrows,
+                'axes': [axis.tolist() for axis in axes], 'stats': list(STATS),
+                'step': step, 'interpolation_error': errors, 'files': _data_digests()}
+    if model == 'selected':
+        from diagism.model_store import model_key
+        manifest['models'] = [model_key(predictor.columns, DICT_PAR[param])
+                              for param in parameters]
+    atomic_write(os.path.join(path, MANIFEST),
+                 lambda file: json.dump(manifest, file, indent=1), 'w')
+    return path
+
+
+def interpolate(axes, table, missing, values):
+    """Multilinear interpolation of a grid table at values (one per axis), or None.
+
+    None is returned outside of the grid and next to nodes without similar
+    simulated galaxies.
+    """
+    lower, weights = [], []
+    for value, axis in zip(values, axes):
+        if not axis[0] - 1e-9 <= value <= axis[-1] + 1e-9:
+            return None
+        inode = int(np.clip(np.searchsorted(axis, value, side='right') - 1,
+                            0, len(axis) - 2))
+        frac = float(np.clip((value - axis[inode]) / (axis[inode+1] - axis[inode]), 0, 1))
+        lower.append(inode)
+        weights.append(frac)
+    result = np.zeros(table.shape[-2:])
+    for corner in itertools.product((0, 1), repeat=len(lower)):
+        weight = np.prod([frac if side else 1 - frac
+                          for side, frac in zip(corner, weights)])
+        if weight == 0:
+            continue
+        node = tuple(inode + side for inode, side in zip(lower, corner))
+        if missing[node]:
+            return None
+        result += weight * table[node]
+    return result
+
+
+class QuantileGrid:
+    """Memory-mapped quantile grid, interpolated multilinearly"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as file:
+            self.manifest = json.load(file)
+        self.columns = self.manifest['columns']
+        self.parameters = self.manifest['parameters']
+        self.axes = [np.asarray(axis) for axis in self.manifest['axes']]
+        self.table = np.load(os.path.join(path, 'table.npy'), mmap_mode='r')
+        self.missing = np.load(os.path.join(path, 'missing.npy'), mmap_mode='r')
+
+    def usable(self, model, columns, sigma, parameters):
+        """Whether the grid was built for this request and the current data files"""
+        manifest = self.manifest
+        if (manifest['model'] != model or self.columns != list(columns)
+                or not np.isclose(manifest['sigma'], sigma)
+                or not set(parameters) <= set(self.parameters)
+                or manifest['seed'] != mocks.SEED or manifest['nrows'] != mocks.NROWS
+                or manifest['files'] != _data_digests()
+                or 'interpolation_error' not in manifest):
+            return False
+        if model == 'selected':
+            from diagism.model_store import model_key
+            sim_columns = [DICT_CONV[col] for col in self.columns]
+            return manifest['models'] == [model_key(sim_columns, DICT_PAR[param])
+                                          for param in self.parameters]
+        return True
+
+    def interpolate(self, values):
+        """(nparameters, nstats) statistics at values (one per grid column), or None"""
+        return interpolate(self.axes, self.table, self.missing, values)
+
+    def error_note(self, parameters):
+        """Largest interpolation error of every parameter, for the mocks note"""
+        errors = self.manifest['interpolation_error']
+        return ', '.join('%s %.3f' % (param, max(errors[param].values()))
+                         for param in parameters)
+
+    def lookup(self, values, parameters):
+        """{parameter: one row table} at values, or None"""
+        stats = self.interpolate(values)
+        if stats is None:
+            return None
+        return {param: pd.DataFrame([stats[self.parameters.index(param)]],
+                                    columns=list(STATS))
+                for param in parameters}
+
+
+def available_grids(directory=GRIDS_DIR):
+    """Grids built in directory"""
+    if not os.path.isdir(directory):
+        return []
+    grids = []
+    for name in sorted(os.listdir(directory)):
+        manifest = os.path.join(directory, name, MANIFEST)
+        if os.path.exists(manifest):
+            path = os.path.join(directory, name)
+            grids.append(cached(manifest, 'grid', lambda path=path: QuantileGrid(path)))
+    return grids
+
+
+def grid_lookup(model, columns, values, sigma, parameters, directory=GRIDS_DIR):
+    """Interpolated {parameter: table} of a single galaxy and the grid, or None.
+
+    None is returned without a usable grid. columns are the user columns with a
+    value and values their values.
+    """
+    order = [col for col in DICT_CONV if col in columns]
+    values = [values[list(columns).index(col)] for col in order]
+    for grid in available_grids(directory):
+        if grid.usable(model, order, sigma, parameters):
+            result = grid.lookup(values, parameters)
+            if result is not None:
+                return result, grid
+    return None
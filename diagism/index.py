@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Index over the simulation features for the +-sigma neighbour box queries.
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+
+
+class BoxIndex:
+    """Sorted copy of every simulation column answering axis-aligned box queries.
+
+    A query on any subset of the columns starts from the rows of the most
+    selective column, found with searchsorted, and checks the remaining columns
+    on those candidates only. NaN values are sorted last and never match.
+    """
+
+    def __init__(self, features):
+        self.columns = np.ascontiguousarray(np.asarray(features, dtype=np.float64).T)
+        self.order = np.argsort(self.columns, axis=1, kind='stable')
+        self.sorted = np.take_along_axis(self.columns, self.order, axis=1)
+        for array in (self.columns, self.order, self.sorted):
+            array.flags.writeable = False
+
+    @property
+    def nsim(self):
+        return self.columns.shape[1]
+
+    def query(self, lower, upper, mask):
+        """Rows inside the boxes, one sorted index array per box.
+
+        lower, upper and mask have shape (nbox, ncolumns); only the columns where
+        mask is True constrain a box, and a box without constraints matches all
+        the rows.
+        """
+        lower = np.asarray(lower, dtype=np.float64)
+        upper = np.asarray(upper, dtype=np.float64)
+        mask = np.asarray(mask, dtype=bool)
+        nbox, ncol = mask.shape
+        left = np.empty((nbox, ncol), dtype=np.intp)
+        right = np.empty((nbox, ncol), dtype=np.intp)
+        for col in range(ncol):
+            left[:, col] = np.searchsorted(self.sorted[col], lower[:, col], side='left')
+            right[:, col] = np.searchsorted(self.sorted[col], upper[:, col], side='right')
+        width = np.where(mask, np.maximum(right-left, 0), self.nsim+1)
+        best = np.argmin(width, axis=1)
+
+        rows = []
+        for ibox in range(nbox):
+            cols = np.flatnonzero(mask[ibox])
+            if not len(cols):
+                rows.append(np.arange(self.nsim))
+                continue
+            first = best[ibox]
+            cand = self.order[first, left[ibox, first]:right[ibox, first]]
+            for col in cols:
+                if col == first or not len(cand):
+                    continue
+                vals = self.columns[col, cand]
+                cand = cand[(vals >= lower[ibox, col]) & (vals <= upper[ibox, col])]
+            rows.append(np.sort(cand))
+        return rows
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Predictions of the trained models for the mock cubes.
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+import pandas as pd
+
+# Mock rows sent to the model at once, which bounds the memory of the hidden layers
+CHUNK_ROWS = 1 << 16
+QUANTILES = (0.16, 0.5, 0.84)
+
+
+class ScaledRegressor:
+    """scikit-learn model between the scaler of its inputs and the one of its output"""
+
+    def __init__(self, scalerx, regr_mlp, scalery):
+        self.scalerx = scalerx
+        self.regr_mlp = regr_mlp
+        self.scalery = scalery
+
+    def predict(self, X):
+        part = self.regr_mlp.predict(self.scalerx.transform(X))
+        return self.scalery.inverse_transform(part.reshape(-1, 1)).ravel()
+
+
+def predict_mocks(mocks, model, chunk_rows=CHUNK_ROWS):
+    """Predicted parameter for every mock, as an (ngal, nrows) array.
+
+    model predicts in physical units, either a NumpyMLP with the scalers
+    folded in or a ScaledRegressor. The whole (ngal, nrows, nlines) cube goes
+    through it in chunks of chunk_rows mocks. The predictions have the dtype
+    of the mocks.
+    """
+    ngal, nrows, nlines = mocks.shape
+    flat = mocks.reshape(-1, nlines)
+    predictions = np.empty(len(flat), dtype=mocks.dtype)
+    for start in range(0, len(flat), chunk_rows):
+        part = model.predict(flat[start:start+chunk_rows])
+        predictions[start:start+len(part)] = part
+    return predictions.reshape(ngal, nrows)
+
+
+def summarise(predictions, index=None):
+    """Per galaxy statistics of the predictions, as shown and saved by the pages.
+
+    predictions is an (ngal, nrows) array, or a list with the predictions of
+    each galaxy when they have different numbers of mocks. The statistics are
+    computed in float64 whatever the precision of the predictions.
+    """
+    if isinstance(predictions, list):
+        predictions = [np.asarray(pred, dtype=np.float64) for pred in predictions]
+        stats = np.array([[*np.quantile(pred, QUANTILES), pred.mean(), pred.std()]
+                          for pred in predictions]).reshape(-1, 5)
+        per_16th, median, per_84th, mean, std = stats.T
+    else:
+        predictions = np.asarray(predictions, dtype=np.float64)
+        per_16th, median, per_84th = np.quantile(predictions, QUANTILES, axis=1)
+        mean, std = predictions.mean(axis=1), predictions.std(axis=1)
+    return pd.DataFrame({"per_16th": per_16th, "median": median, "per_84th": per_84th,
+                         "mean": mean, "std": std}, index=index)
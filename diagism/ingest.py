@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Validated reading of the CSV catalogues, chunk by chunk.
+
+The header is checked once against the columns of the CSV information page and
+the columns are put in the order used by the models. Every value is read as
+text and converted to float64, so a malformed row is rejected with a report of
+its line instead of failing the whole file or turning a column into strings.
+Empty cells (and the usual NaN spellings) are missing values, as in pandas.
+@author: Andres Felipe Ramos Padilla
+"""
+import csv
+import io
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from diagism.columns import DICT_CONV
+
+# Fixed schema of the input: every known column is a float64
+SCHEMA = {col: np.float64 for col in DICT_CONV}
+CHUNK_SIZE = 1000
+MAX_ERRORS = 100
+MISSING = {'', 'nan', 'NaN', 'NAN', 'NA', 'N/A', 'n/a', 'null', 'NULL', 'None'}
+
+# line is the line of the file (the header is line 1), column is None when the
+# whole row is wrong
+RowError = namedtuple('RowError', ['line', 'column', 'value', 'reason'])
+
+
+def validate_header(names):
+    """Column names of a catalogue in the order used by the models.
+
+    Raises ValueError for unknown, duplicated or missing column names.
+    """
+    names = [name.strip() for name in names]
+    if not any(names):
+        raise ValueError('The CSV file has no header, check the CSV information')
+    unknown = [name for name in names if name not in SCHEMA]
+    if unknown:
+        raise ValueError('Column names are not correct, check the CSV information: %s'
+                         % unknown)
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError('Columns appear more than once: %s' % duplicated)
+    return [col for col in SCHEMA if col in names]
+
+
+def _text(source):
+    """Text stream of a path, a text file or a binary file (as Streamlit uploads).
+
+    Files are read from the start, so the same upload can be read at every rerun.
+    """
+    if isinstance(source, str):
+        return open(source, newline='', encoding='utf-8-sig')
+    if source.seekable():
+        source.seek(0)
+    if isinstance(source, io.TextIOBase):
+        return source
+    return io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+
+
+class Ingestion:
+    """Reader of a CSV catalogue in validated chunks.
+
+    Iterating gives DataFrames of at most chunksize valid galaxies, with the
+    float64 columns of the schema in the order of the models and indexed by
+    the row of each galaxy in the file (0 for the first row after the header).
+    Rejected rows are counted in nrejected and the first max_errors of them
+    are reported in errors.
+    """
+
+    def __init__(self, source, chunksize=CHUNK_SIZE, max_errors=MAX_ERRORS):
+        self.source = source
+        self.chunksize = chunksize
+        self.max_errors = max_errors
+        self.columns = None
+        self.errors = []
+        self.nrows = 0
+        self.nrejected = 0
+
+    def _reject(self, line, column, value, reason):
+        if len(self.errors) < self.max_errors:
+            self.errors.append(RowError(line, column, value, reason))
+
+    def __iter__(self):
+        self.errors, self.nrows, self.nrejected = [], 0, 0
+        stream = _text(self.source)
+        try:
+            reader = csv.reader(stream)
+            header = next(reader, [])
+            names = [name.strip() for name in header]
+            self.columns = validate_header(names)
+            order = [names.index(col) for col in self.columns]
+            rows, lines, positions = [], [], []
+            for fields in reader:
+                if not fields or not ''.join(fields).strip():
+                    continue
+                position = self.nrows
+                self.nrows += 1
+                if len(fields) != len(names):
+                    self.nrejected += 1
+                    self._reject(reader.line_num, None, None, 'expected %i fields, found %i'
+                                 % (len(names), len(fields)))
+                    continue
+                rows.append([fields[icol].strip() for icol in order])
+                lines.append(reader.line_num)
+                positions.append(position)
+                if len(rows) == self.chunksize:
+                    chunk = self._convert(rows, lines, positions)
+                    rows, lines, positions = [], [], []
+                    if len(chunk):
+                        yield chunk
+            if rows:
+                chunk = self._convert(rows, lines, positions)
+                if len(chunk):
+                    yield chunk
+        finally:
+            if isinstance(self.source, str):
+                stream.close()
+            elif not isinstance(self.source, io.TextIOBase):
+                # Keep the caller's binary file open
+                stream.detach()
+
+    def _convert(self, rows, lines, positions):
+        """Float64 DataFrame of the valid rows of a chunk"""
+        text = np.array(rows, dtype=object).reshape(len(rows), len(self.columns))
+        values = np.empty(text.shape, dtype=np.float64)
+        valid = np.ones(len(rows), dtype=bool)
+        for icol, col in enumerate(self.columns):
+            missing = np.isin(text[:, icol], list(MISSING))
+            number = pd.to_numeric(pd.Series(text[:, icol]).where(~missing),
+                                   errors='coerce').to_numpy(dtype=SCHEMA[col])
+            for irow in np.flatnonzero(~missing & ~np.isfinite(number)):
+                reason = 'not a number' if np.isnan(number[irow]) else 'not finite'
+                self._reject(lines[irow], col, text[irow, icol], reason)
+                valid[irow] = False
+            values[:, icol] = number
+        empty = np.isnan(values).all(axis=1) & valid
+        for irow in np.flatnonzero(empty):
+            self._reject(lines[irow], None, None, 'no values')
+        valid &= ~empty
+        self.nrejected += int((~valid).sum())
+        return pd.DataFrame(values[valid], columns=self.columns,
+                            index=np.asarray(positions)[valid])
+
+    def read(self):
+        """Whole catalogue as a single DataFrame"""
+        chunks = list(self)
+        if not chunks:
+            return pd.DataFrame({col: pd.Series(dtype=SCHEMA[col]) for col in self.columns})
+        return pd.concat(chunks)
+
+    def error_table(self):
+        """Reported errors as a DataFrame"""
+        return pd.DataFrame(self.errors, columns=RowError._fields)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Wall time and peak memory of the stages of a prediction.
+
+    timer = StageTimer(trace_memory=True)
+    with timer.stage('mocks'):
+        ...
+
+Stages entered several times (one per parameter, for instance) add up. Peak
+memory comes from tracemalloc, which slows down the code it traces, so it is
+only measured on request, and tracing stops as soon as no stage of such a
+timer is running. tracemalloc is process-wide, so the peaks include the
+allocations of other sessions running at the same time. A nested stage has
+its own peak, which also counts in the peak of the enclosing stage.
+Every run can be appended as a JSON line to the file named by the
+DIAGISM_TIMINGS environment variable, to follow regressions in production.
+@author: Andres Felipe Ramos Padilla
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import pandas as pd
+
+TIMINGS_ENV = 'DIAGISM_TIMINGS'
+_EXPORT_LOCK = threading.Lock()
+
+# Running stages that trace memory, and whether tracing was started for them
+_TRACERS = 0
+_OWN_TRACING = False
+_TRACE_LOCK = threading.Lock()
+
+
+def _start_tracing():
+    global _TRACERS, _OWN_TRACING
+    with _TRACE_LOCK:
+        if _TRACERS == 0:
+            _OWN_TRACING = not tracemalloc.is_tracing()
+            if _OWN_TRACING:
+                tracemalloc.start()
+        _TRACERS += 1
+
+
+def _stop_tracing():
+    global _TRACERS
+    with _TRACE_LOCK:
+        _TRACERS -= 1
+        if _TRACERS == 0 and _OWN_TRACING:
+            tracemalloc.stop()
+
+
+class StageTimer:
+    """Wall time (and peak memory) of every stage of a run"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = OrderedDict()
+        # [traced memory at the start, highest peak so far] of the running stages
+        self._peaks = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            if self._peaks:
+                # reset_peak() would forget the peak of the enclosing stage so far
+                self._peaks[-1][1] = max(self._peaks[-1][1], tracemalloc.get_traced_memory()[1])
+            else:
+                _start_tracing()
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            self._peaks.append([current, current])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'seconds': 0.0, 'peak_mb': None, 'calls': 0})
+            entry['seconds'] += time.perf_counter() - start
+            entry['calls'] += 1
+            if self.trace_memory:
+                base, highest = self._peaks.pop()
+                highest = max(highest, tracemalloc.get_traced_memory()[1])
+                entry['peak_mb'] = max(entry['peak_mb'] or 0.0, (highest - base) / 2**20)
+                if self._peaks:
+                    self._peaks[-1][1] = max(self._peaks[-1][1], highest)
+                else:
+                    _stop_tracing()
+
+    def total(self):
+        return sum(entry['seconds'] for entry in self.stages.values())
+
+    def table(self):
+        """Stages as a DataFrame, as shown in the debug sidebar"""
+        return pd.DataFrame.from_dict(self.stages, orient='index',
+                                      columns=['seconds', 'peak_mb', 'calls'])
+
+    def summary(self):
+        """One line description of the stages for the CSV header"""
+        return ', '.join('%s %.3f s' % (name, entry['seconds'])
+                         for name, entry in self.stages.items())
+
+    def export(self, path=None, **context):
+        """Append the stages and context (page, number of galaxies...) as a JSON line.
+
+        path defaults to the DIAGISM_TIMINGS environment variable, and nothing
+        is written when neither is set.
+        """
+        path = path or os.environ.get(TIMINGS_ENV)
+        if not path:
+            return
+        record = dict(context, time=datetime.now(timezone.utc).isoformat(),
+                      total_seconds=self.total(), stages=self.stages)
+        with _EXPORT_LOCK, open(path, 'a') as file:
+            file.write(json.dumps(record, default=str) + '\n')
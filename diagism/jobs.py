@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background training of the selected FIR lines models.
+
+Training runs in a pool of processes so it does not block the script thread of
+Streamlit. Identical requests share a single job: a rerun of the page, or
+another user asking for the same lines, attaches to the job already running.
+The loss of every epoch, printed by MLPRegressor with verbose=True, is sent back
+to follow the progress of the training.
+@author: Andres Felipe Ramos Padilla
+"""
+import atexit
+import contextlib
+import multiprocessing
+import queue
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from diagism.model_store import default_store, model_key
+from diagism.training import canonical_columns, hyperparameters, train_model
+
+MAX_WORKERS = 2
+_ITERATION = re.compile(r'Iteration (\d+), loss = ([-+.\deE]+)')
+
+
+class _ProgressWriter:
+    """File-like object sending the 'Iteration N, loss = X' lines to a queue"""
+
+    def __init__(self, progress):
+        self.progress = progress
+
+    def write(self, text):
+        for match in _ITERATION.finditer(text):
+            self.progress.put((int(match.group(1)), float(match.group(2))))
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _train(columns, parameter, progress):
+    """Train a model in a worker process, reporting every epoch to progress"""
+    with contextlib.redirect_stdout(_ProgressWriter(progress)):
+        return train_model(columns, parameter, verbose=True)
+
+
+class TrainingJob:
+    """Training of one combination of feature columns and parameter"""
+
+    def __init__(self, key, future, progress, max_iter):
+        self.key = key
+        self.max_iter = max_iter
+        self.iteration = 0
+        self.loss = float('nan')
+        self._future = future
+        self._progress = progress
+
+    def done(self):
+        return self._future.done()
+
+    def poll(self):
+        """Latest (iteration, loss) reported by the worker"""
+        try:
+            while True:
+                self.iteration, self.loss = self._progress.get_nowait()
+        except (queue.Empty, OSError, EOFError):
+            pass
+        return self.iteration, self.loss
+
+    def fraction(self):
+        """Fraction of the maximum number of epochs already done"""
+        return min(self.poll()[0] / self.max_iter, 1.0)
+
+    def result(self, timeout=None):
+        """Trained (model, score), waiting for the job to finish"""
+        return self._future.result(timeout)
+
+
+class TrainingQueue:
+    """Process pool running the training jobs, with deduplication of requests"""
+
+    def __init__(self, store, max_workers=MAX_WORKERS):
+        self.store = store
+        self.max_workers = max_workers
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+
+    def _start(self):
+        if self._executor is None:
+            context = multiprocessing.get_context('spawn')
+            self._manager = context.Manager()
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=context)
+
+    def submit(self, columns, parameter):
+        """Running job training a combination, started if there is none.
+
+        Returns None when the model is already in the store.
+        """
+        columns = canonical_columns(columns)
+        key = model_key(columns, parameter)
+        with self._lock:
+            if key in self._jobs:
+                return self._jobs[key]
+            if self.store.has(columns, parameter):
+                return None
+            self._start()
+            progress = self._manager.Queue()
+            future = self._executor.submit(_train, columns, parameter, progress)
+            job = TrainingJob(key, future, progress, hyperparameters(parameter)['max_iter'])
+            self._jobs[key] = job
+        future.add_done_callback(lambda future: self._finish(job, columns, parameter))
+        return job
+
+    def _finish(self, job, columns, parameter):
+        try:
+            if not job._future.cancelled() and job._future.exception() is None:
+                self.store.put(columns, parameter, *job._future.result())
+        finally:
+            with self._lock:
+                self._jobs.pop(job.key, None)
+
+    def running(self):
+        """Number of jobs not finished yet"""
+        with self._lock:
+            return len(self._jobs)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._manager.shutdown()
+            self._executor = self._manager = None
+
+
+_DEFAULT = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_queue():
+    """Training queue shared by all the sessions of the process"""
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = TrainingQueue(default_store())
+            atexit.register(_DEFAULT.shutdown)
+        return _DEFAULT
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mock luminosities used to estimate the error on the predictions.
+
+The mocks of every galaxy are drawn from a normal distribution centred on the
+simulated galaxies that are within +-sigma of the input luminosities. The last
+column of the input is always the redshift, which does not change.
+The cubes can be drawn in float32, which halves their memory, and
+mock_chunks yields them for a few galaxies at a time, so the memory of a
+catalogue is bounded by the chunk and not by the number of galaxies.
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+
+from diagism.index import BoxIndex
+
+NROWS = 2000
+SEED = 42
+# Galaxies per cube of mock_chunks. With 9 columns a cube is 72 MB in float32
+# (144 MB in float64), and drawing it peaks at about 80 MB (160 MB)
+CHUNK_GALAXIES = 1000
+# Galaxies whose normals are drawn at once by draw_mocks
+DRAW_GALAXIES = 16
+
+
+def search_columns(values):
+    """Columns used to look for similar simulated galaxies.
+
+    All the known values except the last one, which is the redshift when it is
+    given.
+    """
+    known = ~np.isnan(values)
+    search = known.copy()
+    has_known = known.any(axis=1)
+    last = values.shape[1] - 1 - np.argmax(known[:, ::-1], axis=1)
+    search[np.flatnonzero(has_known), last[has_known]] = False
+    return search
+
+
+def _describe(sub):
+    """Mean and sample std of each row, with the same arithmetic as pandas describe()"""
+    mask = np.isnan(sub)
+    count = (~mask).sum(axis=1)
+    if mask.any():
+        sub = np.where(mask, 0.0, sub)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sub.sum(axis=1) / count
+        sqr = (mean[:, None] - sub) ** 2
+        sqr[mask] = 0
+        std = np.sqrt(sqr.sum(axis=1) / np.where(count > 1, count - 1, np.nan))
+    return mean, std, count
+
+
+def neighbour_stats(values, features, sigma):
+    """Statistics of the simulated galaxies similar to each input galaxy.
+
+    features is either the (nsim, nlines) simulation columns or a BoxIndex built
+    on them. Returns the mean and std of every feature column for each galaxy,
+    as arrays with the shape of values, and a boolean array telling which
+    galaxies had at least two similar simulated galaxies.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    index = features if isinstance(features, BoxIndex) else BoxIndex(features)
+    ngal, nlines = values.shape
+    mean = np.empty((ngal, nlines))
+    std = np.empty((ngal, nlines))
+    found = np.zeros(ngal, dtype=bool)
+
+    neighbours = index.query(values-sigma, values+sigma, search_columns(values))
+    for igal, rows in enumerate(neighbours):
+        mean[igal], std[igal], count = _describe(index.columns[:, rows])
+        found[igal] = (count > 1).all()
+    return mean, std, found
+
+
+def fallback_stats(values):
+    """Statistics used when there are no similar simulated galaxies"""
+    mean = np.nanmean(values[:-1])
+    std = max(np.nanstd(values[:-1]), 0.05)
+    return mean, std
+
+
+def mock_stats(values, features, sigma):
+    """Mean and std the mocks of every galaxy are drawn from.
+
+    Those of the similar simulated galaxies, or fallback_stats for the
+    galaxies without them, whose indices are also returned.
+    """
+    mean, std, found = neighbour_stats(values, features, sigma)
+    missing = np.flatnonzero(~found)
+    for igal in missing:
+        mean[igal], std[igal] = fallback_stats(values[igal])
+    return mean, std, missing
+
+
+class GalaxyStreams:
+    """Independent random stream for every galaxy, seeded with its position.
+
+    The mocks of a galaxy then depend only on the seed and on its row in the
+    catalogue, and not on how the catalogue is split in chunks or workers.
+    Consecutive calls continue with the following rows. rows gives instead the
+    row of every galaxy, when galaxies of several catalogues are drawn together.
+    """
+
+    def __init__(self, seed=SEED, first=0, rows=None):
+        self.seed = seed
+        self.first = first
+        self.rows = None if rows is None else np.asarray(rows)
+
+    def _next_rows(self, ngal):
+        if self.rows is None:
+            rows = self.first + np.arange(ngal)
+        else:
+            rows, self.rows = self.rows[:ngal], self.rows[ngal:]
+        self.first += ngal
+        return rows
+
+    def standard_normal(self, counts):
+        """Concatenated normals of consecutive galaxies, counts[i] for galaxy i"""
+        normals = np.empty(int(np.sum(counts)))
+        start = 0
+        for row, count in zip(self._next_rows(len(counts)), counts):
+            rng = np.random.default_rng([self.seed, int(row)])
+            normals[start:start+count] = rng.standard_normal(count)
+            start += count
+        return normals
+
+
+def draw_mocks(values, mean, std, sigma, sys_error, rng, nrows=NROWS, dtype=np.float64):
+    """Mock cube of shape (ngal, nrows, nlines) from the neighbour statistics.
+
+    The normals are drawn from rng in the order of the original per galaxy and
+    per column loop: for every column the draw around the neighbours, followed
+    by the draw around the input value when the luminosity is known. A
+    RandomState seeded as before therefore gives the same mocks as the loop
+    did. rng can also be a GalaxyStreams, whose standard_normal is called once
+    per block with the counts of its consecutive galaxies.
+    The normals are drawn in float64 for DRAW_GALAXIES galaxies at a time and
+    written straight into the cube, so a float32 cube has the same mocks
+    rounded to single precision, and the memory is the cube plus a few MB.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    known = ~np.isnan(values)
+    jitter = known.copy()
+    jitter[:, -1] = False
+    nblocks = 1 + jitter
+    mocks = np.empty(values.shape[:1] + (nrows,) + values.shape[1:], dtype=dtype)
+    mean = mean.astype(dtype)
+    scale = np.sqrt(sigma**2 + std**2).astype(dtype)
+    jitter_sigma = sigma if sys_error else 0.01
+    for start in range(0, len(values), DRAW_GALAXIES):
+        stop = start + DRAW_GALAXIES
+        blocks = nblocks[start:stop]
+        first = np.cumsum(blocks.ravel()).reshape(blocks.shape) - blocks
+        if isinstance(rng, GalaxyStreams):
+            normals = rng.standard_normal(blocks.sum(axis=1)*nrows)
+        else:
+            normals = rng.standard_normal(int(blocks.sum())*nrows)
+        normals = normals.reshape(-1, nrows).astype(dtype, copy=False)
+        rows = mean[start:stop, :, None] + scale[start:stop, :, None]*normals[first]
+        gal, col = np.nonzero(jitter[start:stop])
+        rows[gal, col] = (values[start+gal, col, None].astype(dtype)
+                          + jitter_sigma*normals[first[gal, col]+1])
+        mocks[start:stop] = rows.transpose(0, 2, 1)
+    # Redshift does not change
+    fixed = np.flatnonzero(known[:, -1])
+    mocks[fixed, :, -1] = values[fixed, -1, None]
+    return mocks
+
+
+def create_mocks(values, features, sigma=0.2, sys_error=False, seed=SEED, nrows=NROWS,
+                 rng=None, dtype=np.float64):
+    """Create mock values to estimate the error on the prediction.
+
+    values is the (ngal, nlines) array of inputs, with NaN for the unknown
+    luminosities, and features the matching (nsim, nlines) simulation columns.
+    Returns the (ngal, nrows, nlines) mocks and the indices of the galaxies
+    without similar simulated galaxies, for which the average of the input
+    luminosities was used instead. Passing the same RandomState (or
+    GalaxyStreams) as rng to consecutive calls gives the same mocks as a single
+    call on the whole catalogue. dtype is the precision of the mocks.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mean, std, missing = mock_stats(values, features, sigma)
+    if rng is None:
+        rng = np.random.RandomState(seed)
+    return draw_mocks(values, mean, std, sigma, sys_error, rng, nrows, dtype), missing
+
+
+def mock_chunks(values, features, sigma=0.2, sys_error=False, seed=SEED, nrows=NROWS,
+                rng=None, dtype=np.float64, chunk_galaxies=CHUNK_GALAXIES):
+    """Mocks of consecutive chunks of galaxies, as create_mocks would give them.
+
+    Yields (start, mocks, missing) for every chunk of chunk_galaxies galaxies,
+    where start is the row of its first galaxy in values and missing the
+    indices of its galaxies without similar simulated galaxies, relative to
+    start. Only one cube is alive at a time when the caller does not keep it.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if rng is None:
+        rng = np.random.RandomState(seed)
+    for start in range(0, len(values), chunk_galaxies):
+        faked, missing = create_mocks(values[start:start+chunk_galaxies], features, sigma,
+                                      sys_error, nrows=nrows, rng=rng, dtype=dtype)
+        yield start, faked, missing
+        # Otherwise the previous cube stays alive while the next one is drawn
+        del faked
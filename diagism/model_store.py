@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Store of the trained models with a selection of FIR lines.
+
+Models are kept on disk, keyed by the feature columns, the parameter, the
+hyperparameters and the dataset, with an in-memory LRU in front. Only the first
+request for a combination pays the training cost. The whole store can be filled
+offline with python -m diagism warm
+@author: Andres Felipe Ramos Padilla
+"""
+import hashlib
+import itertools
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from diagism.columns import COL_ANALT, DICT_PAR
+from diagism.resources import (FILES_DIR, DATASET_FILE, atomic_write, evict_lru, file_digest,
+                               mark_used)
+from diagism.training import canonical_columns, hyperparameters_hash, train_model
+
+STORE_DIR = os.path.join(FILES_DIR, 'model_store')
+MEMORY_SIZE = 32
+DISK_SIZE = 1 << 30
+
+
+def model_key(columns, parameter):
+    """Key of a trained model in the store"""
+    key = '\n'.join(['|'.join(canonical_columns(columns)), parameter,
+                     hyperparameters_hash(parameter), file_digest(DATASET_FILE)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ModelStore:
+    """On-disk store of trained models with an in-memory LRU in front"""
+
+    def __init__(self, directory=STORE_DIR, memory_size=MEMORY_SIZE, disk_size=DISK_SIZE):
+        self.directory = directory
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def has(self, columns, parameter):
+        """Whether a combination is already in the store"""
+        return os.path.exists(self._path(model_key(columns, parameter)))
+
+    def get(self, columns, parameter):
+        """Stored (model, score) of a combination, or None"""
+        key = model_key(columns, parameter)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                stored = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # The modification time tells the eviction which models were used last
+        mark_used(path)
+        entry = (stored['model'], stored['score'])
+        self._remember(key, entry)
+        return entry
+
+    def put(self, columns, parameter, model, score):
+        """Save a trained model to the store"""
+        key = model_key(columns, parameter)
+        os.makedirs(self.directory, exist_ok=True)
+        stored = {'columns': canonical_columns(columns), 'parameter': parameter,
+                  'model': model, 'score': score}
+        atomic_write(self._path(key), lambda file: pickle.dump(stored, file))
+        self._remember(key, (model, score))
+        self.evict()
+
+    def get_or_train(self, columns, parameter, verbose=True):
+        """Stored (model, score) of a combination, training it if needed"""
+        entry = self.get(columns, parameter)
+        if entry is None:
+            entry = train_model(canonical_columns(columns), parameter, verbose)
+            self.put(columns, parameter, *entry)
+        return entry
+
+    def evict(self):
+        """Remove the least recently used models until the store fits on disk"""
+        evict_lru(self.directory, self.disk_size)
+
+
+_DEFAULT = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_store():
+    """Store shared by all the sessions of the process"""
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = ModelStore()
+        return _DEFAULT
+
+
+def all_combinations(min_columns=2):
+    """Every subset of the feature columns with at least min_columns columns"""
+    for ncol in range(min_columns, len(COL_ANALT)+1):
+        for columns in itertools.combinations(COL_ANALT, ncol):
+            yield list(columns)
+
+
+def warm(store, parameters=None, min_columns=2, log=print):
+    """Train and save every combination of feature columns and parameter"""
+    parameters = parameters or list(DICT_PAR.values())
+    for columns in all_combinations(min_columns):
+        for parameter in parameters:
+            if not store.has(columns, parameter):
+                _, score = store.get_or_train(columns, parameter, verbose=False)
+                log('%s %s score=%.3f' % (parameter, columns, score))
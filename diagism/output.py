@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CSV files with the results, as downloaded from the web app.
+
+The five commented header lines describe the run and are followed by the table
+with one row per galaxy, which can be read with header=5 in pandas. When
+several parameters are predicted at once, the table has the columns of all of
+them, prefixed with the name of the parameter. With an adaptive number of mocks
+the table ends with the number of mocks of each galaxy (nmocks).
+@author: Andres Felipe Ramos Padilla
+"""
+from datetime import datetime, timezone
+
+import pandas as pd
+
+EIGHT_LINES = 'Eight FIR lines'
+
+
+def selected_lines(columns):
+    """Description of the model with the selected FIR lines"""
+    return 'Selected FIR lines. Features: %s' % list(columns)
+
+
+def csv_header(parameters, units, scores, model, mocks=None, timings=None):
+    """Commented header of the results file.
+
+    parameters, units and scores are lists with one entry per predicted
+    parameter, or single values. mocks describes the number of mocks when it
+    was not the default one, and timings the time taken by each stage.
+    """
+    if isinstance(parameters, str):
+        parameters, units, scores = [parameters], [units], [scores]
+    h_row1 = b'# Predictions obtained from DiagISM \n'
+    h_row2 = '# Date execution time: %s UTC' % datetime.now(timezone.utc).strftime(
+        "%Y-%m-%d %H:%M:%S")
+    if timings:
+        h_row2 += '. Stages: %s' % timings
+    h_row2 = bytes(h_row2 + ' \n', 'utf-8')
+    if len(parameters) == 1:
+        h_row3 = bytes('# Predicted physical parameter: %s [%s]\n' % (
+            parameters[0], units[0]), 'utf-8')
+        h_row4 = b'# The score of the predictions was: %.3f \n' % scores[0]
+    else:
+        h_row3 = bytes('# Predicted physical parameters: %s\n' % ', '.join(
+            '%s [%s]' % (param, unit) for param, unit in zip(parameters, units)), 'utf-8')
+        h_row4 = bytes('# The scores of the predictions were: %s \n' % ', '.join(
+            '%s %.3f' % (param, score) for param, score in zip(parameters, scores)), 'utf-8')
+    if mocks is not None:
+        model = '%s. %s' % (model, mocks)
+    h_row5 = bytes('# Model: %s \n' % model, 'utf-8')
+    return h_row1 + h_row2 + h_row3 + h_row4 + h_row5
+
+
+def column_prefix(parameter):
+    """Prefix of the result columns of a parameter in a table with several parameters"""
+    return parameter.replace(' ', '_') + '_'
+
+
+def wide_table(results):
+    """Single table from the results of several parameters ({parameter: table}).
+
+    The columns of each parameter are prefixed with its name, except when there
+    is only one parameter.
+    """
+    if len(results) == 1:
+        return next(iter(results.values()))
+    return pd.concat([table.add_prefix(column_prefix(param))
+                      for param, table in results.items()], axis=1)
+
+
+def csv_rows(dataframe, header=True):
+    """Table of results as CSV bytes, with or without the column names"""
+    return dataframe.to_csv(header=header, index_label='id').encode('utf-8')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Predictions of a catalogue split in chunks of galaxies over several processes.
+
+The Predictor (models and neighbour index) is loaded once in the main
+process. Workers are forked when the platform allows it, so they share it
+copy-on-write; otherwise it is sent once to each worker. Every galaxy draws
+its mocks from its own random stream (GalaxyStreams), so the results do not
+depend on the number of workers.
+@author: Andres Felipe Ramos Padilla
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+_PREDICTOR = None
+
+
+def default_workers():
+    """Number of CPUs available to this process"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_worker(predictor=None):
+    global _PREDICTOR
+    # One BLAS thread per worker, the processes already use all the cores
+    threadpool_limits(1)
+    if predictor is not None:
+        _PREDICTOR = predictor
+
+
+def _predict_chunk(first, df, samples=False):
+    if samples:
+        return _PREDICTOR.predict_samples(df, first)
+    return _PREDICTOR.predict(df, first)
+
+
+def predict_chunks(predictor, chunks, workers=None, samples=False):
+    """Predict consecutive DataFrame chunks of a catalogue in parallel.
+
+    Yields the (result, missing) of every chunk in order, or with samples the
+    (result, missing, samples) of Predictor.predict_samples. At most two chunks
+    per worker are in flight, so the input can be streamed.
+    """
+    global _PREDICTOR
+    if not predictor.galaxy_seeds:
+        raise ValueError('Parallel predictions need a Predictor with galaxy_seeds=True')
+    workers = workers or default_workers()
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        _PREDICTOR, initargs = predictor, ()
+    else:
+        context = multiprocessing.get_context('spawn')
+        initargs = (predictor,)
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=initargs) as executor:
+            pending = deque()
+            first = 0
+            for df in chunks:
+                pending.append(executor.submit(_predict_chunk, first, df, samples))
+                first += len(df)
+                if len(pending) >= 2*workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    finally:
+        _PREDICTOR = None
+
+
+def predict_parallel(predictor, df, workers=None, chunksize=500):
+    """Predict a whole catalogue in parallel, as Predictor.predict(df, 0) does"""
+    if not len(df):
+        return predictor.predict(df, 0)
+    offsets = range(0, len(df), chunksize)
+    chunks = (df.iloc[start:start+chunksize] for start in offsets)
+    results = list(predict_chunks(predictor, chunks, workers))
+    missing = np.concatenate([offset + result[1] for offset, result in zip(offsets, results)])
+    return pd.concat([result[0] for result in results]), missing
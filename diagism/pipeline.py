@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prediction pipeline shared by the pages, the API and the service.
+
+    pipeline = Pipeline(PretrainedModels(), ['z', 'Lum_CII_158', 'Lum_OIII_88'])
+    pipeline.add(pipeline.target('SFR'))
+    run = pipeline.run(values)
+
+A model provider gives the score and the model of every parameter:
+PretrainedModels for the eight FIR lines models shipped with the app, and
+TrainedModels for the models trained on demand with the selected lines. The
+pipeline draws the mocks (mock_chunks), predicts them (predictions, the raw
+Monte Carlo samples of every galaxy) and summarises them (run, with the
+result cache and the precomputed grids), timing and memoising every stage.
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+import pandas as pd
+
+from diagism import adaptive, mocks, output
+from diagism.artifacts import eight_lines_score
+from diagism.columns import COL_ANALT, DICT_CONV, DICT_PAR
+from diagism.engine import eight_lines_engine, fuse_model
+from diagism.formats import Metadata
+from diagism.grid import grid_lookup
+from diagism.inference import predict_mocks, summarise
+from diagism.instrument import StageTimer
+from diagism.model_store import default_store
+from diagism.resources import (DATASET_FILE, HYPERPARAMETERS_FILE, MODELS_FILE, feature_index,
+                               file_digest, parameter_unit)
+from diagism.result_cache import default_cache, default_stages, result_key, stage_key
+
+MODELS = ('eight', 'selected')
+
+
+def input_columns(columns, model):
+    """User columns read by a model and the matching simulation columns"""
+    unknown = [col for col in columns if col not in DICT_CONV]
+    if unknown:
+        raise KeyError('Column names are not correct, check the CSV information: %s'
+                       % unknown)
+    if model == 'eight':
+        return list(DICT_CONV), list(COL_ANALT)
+    if model != 'selected':
+        raise ValueError('Unknown model %r, use one of %s' % (model, MODELS))
+    user = [col for col in DICT_CONV if col in columns]
+    if len(user) < 2:
+        raise ValueError('One input is not enough to give you reliable information.')
+    return user, [DICT_CONV[col] for col in user]
+
+
+def _read_only(array):
+    # Memoised stages are shared by the sessions
+    array.flags.writeable = False
+    return array
+
+
+def input_values(df, user_columns):
+    """(ngal, ncolumns) float array of a catalogue, with NaN for the missing columns"""
+    return df.reindex(columns=user_columns).to_numpy(dtype=np.float64)
+
+
+class PretrainedModels:
+    """Eight FIR lines models, trained once and shipped with the app"""
+
+    name = 'eight'
+    sys_error = False
+    bins = 'scott'
+
+    def score(self, columns, column):
+        return eight_lines_score(column)
+
+    def model(self, columns, column):
+        return eight_lines_engine(column)
+
+    def description(self, user_columns):
+        return output.EIGHT_LINES
+
+
+class TrainedModels:
+    """Models of the selected FIR lines, trained on demand.
+
+    trainer(columns, column) gives the fitted MLPRegressor and its score, and
+    defaults to the model store, which trains the models it does not have.
+    """
+
+    name = 'selected'
+    sys_error = True
+    bins = 'freedman'
+
+    def __init__(self, trainer=None):
+        self.trainer = trainer
+        self._fitted = {}
+
+    def _fit(self, columns, column):
+        key = (tuple(columns), column)
+        if key not in self._fitted:
+            if self.trainer is None:
+                self._fitted[key] = default_store().get_or_train(columns, column,
+                                                                 verbose=False)
+            else:
+                self._fitted[key] = self.trainer(columns, column)
+        return self._fitted[key]
+
+    def score(self, columns, column):
+        return self._fit(columns, column)[1]
+
+    def model(self, columns, column):
+        return fuse_model(self._fit(columns, column)[0], columns, column)
+
+    def description(self, user_columns):
+        return output.selected_lines(['log(1+z)' if col == 'z' else col
+                                      for col in user_columns])
+
+
+PROVIDERS = {'eight': PretrainedModels, 'selected': TrainedModels}
+
+
+def model_provider(model):
+    """Provider of a model name ('eight' or 'selected'), or the provider itself"""
+    if not isinstance(model, str):
+        return model
+    if model not in PROVIDERS:
+        raise ValueError('Unknown model %r, use one of %s' % (model, MODELS))
+    return PROVIDERS[model]()
+
+
+class Target:
+    """Model of one physical parameter, with its scalers folded in.
+
+    The score is known once the target is created; the model and the unit are
+    only loaded by load(), for the targets good enough to be predicted.
+    """
+
+    def __init__(self, parameter, provider, columns):
+        if parameter not in DICT_PAR:
+            raise ValueError('Unknown parameter %r, use one of %s' % (parameter, list(DICT_PAR)))
+        self.parameter = parameter
+        self.column = DICT_PAR[parameter]
+        self.provider = provider
+        self.columns = columns
+        self.score = provider.score(columns, self.column)
+        self.engine = None
+        self.unit = None
+
+    def load(self, dtype=np.float64):
+        self.engine = self.provider.model(self.columns, self.column).astype(dtype)
+        self.unit = parameter_unit(self.column)
+        return self
+
+
+class Pipeline:
+    """Mocks, predictions and results of catalogues for the targets of a model.
+
+    columns are the user columns of the catalogues, model a provider or the
+    name of one. All the targets are predicted from the same mocks.
+    With memoise, the neighbour statistics (on the values and sigma), the mock
+    cubes (on the statistics, the random state and the precision) and the
+    predictions (on the mocks and the model) of every chunk are kept in the
+    stage cache, so a rerun with another parameter reuses the mocks, and one
+    with another precision the neighbour statistics.
+    """
+
+    def __init__(self, model, columns=None, sigma=0.2, seed=mocks.SEED, nrows=mocks.NROWS,
+                 dtype=np.float64, chunk_galaxies=mocks.CHUNK_GALAXIES, timer=None,
+                 memoise=True):
+        self.provider = model_provider(model)
+        self.user_columns, self.columns = input_columns(columns or list(DICT_CONV),
+                                                        self.provider.name)
+        self.sigma = sigma
+        self.seed = seed
+        self.nrows = nrows
+        self.dtype = np.dtype(dtype)
+        self.chunk_galaxies = chunk_galaxies
+        self.timer = timer or StageTimer()
+        self.stages = default_stages() if memoise else None
+        self.targets = []
+        self._index = None
+
+    @property
+    def model(self):
+        return self.provider.name
+
+    @property
+    def sys_error(self):
+        return self.provider.sys_error
+
+    @property
+    def description(self):
+        return self.provider.description(self.user_columns)
+
+    @property
+    def index(self):
+        """Neighbour index of the simulation columns, loaded on first use"""
+        if self._index is None:
+            with self.timer.stage('dataset load'):
+                self._index = feature_index(self.columns)
+        return self._index
+
+    def target(self, parameter):
+        """Target of a parameter with its score (training the model if needed)"""
+        with self.timer.stage('score'):
+            return Target(parameter, self.provider, self.columns)
+
+    def add(self, target):
+        """Load the model of a target and predict it with the others"""
+        with self.timer.stage('model load'):
+            self.targets.append(target.load(self.dtype))
+        return target
+
+    def metadata(self, mocks_note=None, timings=None):
+        """Description of the run for the files of results"""
+        return Metadata([target.parameter for target in self.targets],
+                        [target.unit for target in self.targets],
+                        [target.score for target in self.targets],
+                        self.description, mocks_note, timings)
+
+    def header(self, mocks_note=None, timings=None):
+        """Header of the CSV file of the results"""
+        return self.metadata(mocks_note, timings).csv_header()
+
+    def _memo(self, key, compute):
+        """compute() memoised on key in the stage cache, when there is one"""
+        if self.stages is None or key is None:
+            return compute()
+        return self.stages.get_or_compute(key, compute)
+
+    def _stats(self, values):
+        """Key and {'mean', 'std', 'missing'} of the neighbours of a chunk of galaxies"""
+        key = stage_key('neighbours', values, self.columns, self.sigma,
+                        file_digest(DATASET_FILE))
+        index = self.index
+
+        def compute():
+            mean, std, missing = mocks.mock_stats(values, index, self.sigma)
+            return {'mean': _read_only(mean), 'std': _read_only(std),
+                    'missing': _read_only(missing)}
+        with self.timer.stage('neighbours'):
+            return key, self._memo(key, compute)
+
+    def _mocks(self, values, stats_key, stats, rng):
+        """Key (None when not memoised) and mock cube of a chunk of galaxies.
+
+        Only the mocks drawn from a RandomState are memoised, keyed on its state,
+        which is restored after a cached cube as if it had been drawn.
+        """
+        key = None
+        if self.stages is not None and isinstance(rng, np.random.RandomState):
+            _, keys, pos, has_gauss, gauss = rng.get_state()
+            key = stage_key('mocks', stats_key, keys, [int(pos), int(has_gauss), float(gauss)],
+                            self.nrows, self.sys_error, self.dtype.name)
+
+        def compute():
+            cube = mocks.draw_mocks(values, stats['mean'], stats['std'], self.sigma,
+                                    self.sys_error, rng, self.nrows, self.dtype)
+            if key is None:
+                return cube
+            return {'mocks': _read_only(cube), 'state': rng.get_state()}
+        with self.timer.stage('mocks'):
+            if key is None:
+                # GalaxyStreams, or no cache: nothing to key or restore
+                return None, compute()
+            entry = self._memo(key, compute)
+            rng.set_state(entry['state'])
+        return key, entry['mocks']
+
+    def _chunks(self, values, rng):
+        if rng is None:
+            rng = np.random.RandomState(self.seed)
+        values = np.asarray(values, dtype=np.float64)
+        for start in range(0, len(values), self.chunk_galaxies):
+            part = values[start:start+self.chunk_galaxies]
+            stats_key, stats = self._stats(part)
+            key, cube = self._mocks(part, stats_key, stats, rng)
+            yield start, cube, stats['missing'], key
+            # Only one cube is alive while the next one is drawn
+            del cube
+
+    def mock_chunks(self, values, rng=None):
+        """Mock cubes of consecutive chunks of galaxies, as (start, mocks, missing).
+
+        rng defaults to a RandomState of the seed of the pipeline; the mocks are
+        those of mocks.mock_chunks. The cubes are read-only.
+        """
+        for start, cube, missing, _ in self._chunks(values, rng):
+            yield start, cube, missing
+
+    def _predict(self, cube_key, cube, target):
+        """Predictions of a mock cube by a target, memoised with the cube"""
+        key = None
+        if cube_key is not None:
+            key = stage_key('predictions', cube_key, self.model, self.columns, target.column,
+                            self.dtype.name, file_digest(MODELS_FILE),
+                            file_digest(HYPERPARAMETERS_FILE))
+        with self.timer.stage('prediction'):
+            return self._memo(key, lambda: {'predictions': _read_only(
+                predict_mocks(cube, target.engine))})['predictions']
+
+    def predictions(self, values, rng=None):
+        """Predictions of every mock, as a {parameter: (ngal, nrows) array} dict.
+
+        Also returns the indices of the galaxies without similar simulated
+        galaxies.
+        """
+        predictions = {target.parameter: np.empty((len(values), self.nrows), dtype=self.dtype)
+                       for target in self.targets}
+        missing = [np.empty(0, dtype=int)]
+        for start, cube, chunk_missing, key in self._chunks(values, rng):
+            for target in self.targets:
+                predictions[target.parameter][start:start+len(cube)] = self._predict(
+                    key, cube, target)
+            missing.append(start + chunk_missing)
+            del cube
+        return predictions, np.concatenate(missing)
+
+    def chunk_results(self, values, index=None, rng=None):
+        """Results of consecutive chunks of galaxies, as soon as they are predicted.
+
+        Yields the table of the statistics of all the targets, the galaxies
+        without similar simulated galaxies (positions in values) and the
+        {parameter: (ngal, nrows) array} predictions of every chunk.
+        """
+        for start, cube, chunk_missing, key in self._chunks(values, rng):
+            stop = start + len(cube)
+            predictions = {target.parameter: self._predict(key, cube, target)
+                           for target in self.targets}
+            del cube
+            chunk_index = None if index is None else index[start:stop]
+            with self.timer.stage('summary'):
+                table = output.wide_table({param: summarise(pred, index=chunk_index)
+                                           for param, pred in predictions.items()})
+            yield table, start + chunk_missing, predictions
+
+    def summaries(self, values, index=None, rng=None):
+        """Table of the statistics of all the targets, summarised chunk by chunk.
+
+        Unlike predictions, the mocks and their predictions are dropped after
+        every chunk. Also returns the galaxies without similar simulated galaxies.
+        """
+        tables, missing = [], [np.empty(0, dtype=int)]
+        for table, chunk_missing, _ in self.chunk_results(values, index, rng):
+            tables.append(table)
+            missing.append(chunk_missing)
+        if not tables:
+            empty = np.empty((0, self.nrows))
+            tables.append(output.wide_table({target.parameter: summarise(empty, index=index)
+                                             for target in self.targets}))
+        return pd.concat(tables), np.concatenate(missing)
+
+    def adaptive(self, values, tolerance, first=0):
+        """Predictions with an adaptive number of mocks, see adaptive_predictions"""
+        with self.timer.stage('mocks and prediction'):
+            return adaptive.adaptive_predictions(
+                values, self.index, {target.parameter: target.engine for target in self.targets},
+                self.sigma, self.sys_error, tolerance, seed=self.seed, first=first,
+                dtype=self.dtype)
+
+    def grid_run(self, values):
+        """Results of a single galaxy interpolated in a precomputed grid, or None"""
+        known = np.isfinite(values)
+        parameters = [target.parameter for target in self.targets]
+        with self.timer.stage('grid lookup'):
+            found = grid_lookup(self.model, list(np.asarray(self.user_columns)[known]),
+                                values[known], self.sigma, parameters)
+        if found is None:
+            return None
+        results, grid = found
+        table = output.wide_table(results)
+        note = ('Interpolated in a precomputed grid (%i mocks per node, luminosity step '
+                '%g dex); largest interpolation error between nodes: %s'
+                % (mocks.NROWS, grid.manifest['step'], grid.error_note(parameters)))
+        return {'predictions': {param: None for param in parameters}, 'results': results,
+                'table': table, 'csv': output.csv_rows(table), 'missing': [],
+                'mocks_note': note}
+
+    def run(self, values, galaxy_ids=None, tolerance=None, grids=False, cache=None):
+        """Predictions, tables and CSV rows of the galaxies, reusing identical past runs.
+
+        values is the (ngal, ncolumns) array of the user columns. Returns a dict
+        with the predictions and the table of each parameter, the table of all
+        the parameters, its CSV rows, the galaxies without similar simulated
+        galaxies and the description of the mocks for the CSV header. With
+        grids, a single galaxy is interpolated in a precomputed grid if there
+        is one.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if grids and galaxy_ids is None and tolerance is None and len(values) == 1:
+            run = self.grid_run(values[0])
+            if run is not None:
+                return run
+        key = result_key(values, [] if galaxy_ids is None else galaxy_ids, self.columns,
+                         [target.parameter for target in self.targets], self.model,
+                         self.sigma, self.seed, self.nrows, tolerance, self.dtype.name)
+        cache = default_cache() if cache is None else cache
+        return cache.get_or_compute(key, lambda: self._compute(values, galaxy_ids, tolerance))
+
+    def _compute(self, values, galaxy_ids, tolerance):
+        if tolerance is None:
+            predictions, missing = self.predictions(values)
+            nmocks = mocks_note = None
+        else:
+            predictions, nmocks, missing = self.adaptive(values, tolerance)
+            mocks_note = adaptive.mocks_note(nmocks, tolerance)
+        with self.timer.stage('summary'):
+            results = {param: summarise(pred, index=galaxy_ids)
+                       for param, pred in predictions.items()}
+            table = output.wide_table(results)
+            if nmocks is not None:
+                table['nmocks'] = nmocks
+        with self.timer.stage('CSV encoding'):
+            csv = output.csv_rows(table)
+        return {'predictions': predictions, 'results': results, 'table': table, 'csv': csv,
+                'missing': missing, 'mocks_note': mocks_note}
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Process-wide loading of the DiagISM data files.
+
+Streamlit runs every session in the same process, so each file is read once and
+shared by all of them. Entries are keyed on the file signature (modification
+time and size) and are reloaded as soon as the file on disk changes.
+The returned objects are shared: callers must not modify them in place.
+When the dataset has been converted to a column store (diagism.columnar), the
+columns are memory-mapped from it instead of decoding the FITS file.
+@author: Andres Felipe Ramos Padilla
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from diagism.columnar import MANIFEST, ColumnStore, convert
+from diagism.index import BoxIndex
+
+FILES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files')
+DATASET_FILE = os.path.join(FILES_DIR, 'complete_dataset.fits')
+MODELS_FILE = os.path.join(FILES_DIR, 'AllLines_trained')
+HYPERPARAMETERS_FILE = os.path.join(FILES_DIR, 'Hyperparameters_table.csv')
+
+_CACHE = {}
+_LOCK = threading.RLock()
+
+
+def file_signature(path):
+    """Cheap signature of a file used to detect changes on disk"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def cached(path, key, build):
+    """Return build() memoised on key and on the current signature of path"""
+    path = os.path.abspath(path)
+    stamp = file_signature(path)
+    # Building under the lock avoids duplicate copies when several sessions
+    # ask for the same file at once.
+    with _LOCK:
+        entry = _CACHE.get((path, key))
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, build())
+            _CACHE[(path, key)] = entry
+        return entry[1]
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+def atomic_write(path, write, mode='wb'):
+    """Write a file with write(file), replacing path at once when it is complete.
+
+    Readers in other sessions or processes never see a half written file.
+    """
+    with tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(path), suffix='.tmp',
+                                     delete=False) as file:
+        try:
+            write(file)
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
+    os.replace(file.name, path)
+
+
+def mark_used(path):
+    """Update the modification time of a file read from an LRU directory"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        # Evicted by another process after it was read
+        pass
+
+
+def evict_lru(directory, max_size, suffix='.pkl'):
+    """Remove the least recently used files of directory until they fit in max_size bytes.
+
+    The files are ordered by modification time (see mark_used), and several
+    processes can evict the same directory at once.
+    """
+    files = []
+    for name in os.listdir(directory):
+        if name.endswith(suffix):
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in files)
+    for _, size, name in sorted(files):
+        if total <= max_size:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def clear_cache():
+    """Forget every loaded file"""
+    with _LOCK:
+        _CACHE.clear()
+
+
+def file_digest(path):
+    """SHA-256 of a file, recomputed only when the file changes"""
+    def build():
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    return cached(path, 'digest', build)
+
+
+def _column_values(table, name):
+    """Column of an astropy table as a native float64 array"""
+    column = table[name]
+    if hasattr(column, 'filled'):
+        column = column.filled(np.nan)
+    return np.asarray(column, dtype=np.float64)
+
+
+def columns_dir(path=DATASET_FILE):
+    """Directory of the column store of a dataset"""
+    return os.path.splitext(path)[0] + '.columns'
+
+
+def column_store(path=DATASET_FILE):
+    """ColumnStore of a dataset, or None if it was not converted or is out of date"""
+    manifest = os.path.join(columns_dir(path), MANIFEST)
+    if not os.path.exists(manifest):
+        return None
+
+    def build():
+        store = ColumnStore(columns_dir(path))
+        return store if store.manifest['sha256'] == file_digest(path) else None
+    return cached(manifest, ('store', file_signature(path)), build)
+
+
+def load_dataset(path=DATASET_FILE):
+    """Simulation dataset with the log(1+z) column already computed"""
+    def build():
+        from astropy.table import Table
+        dataset = Table.read(path, format='fits')
+        dataset['log(1+z)'] = np.log10(dataset['z']+1)
+        return dataset
+    return cached(path, 'table', build)
+
+
+def feature_matrix(columns, path=DATASET_FILE):
+    """Read-only (nsim, ncolumns) float64 array of the given dataset columns.
+
+    The array is Fortran ordered, so its transpose is a C-contiguous
+    (ncolumns, nsim) view with one row per column.
+    """
+    columns = tuple(columns)
+
+    def build():
+        store = column_store(path)
+        if store is not None:
+            return store.features(columns)
+        dataset = load_dataset(path)
+        matrix = np.empty((len(dataset), len(columns)), order='F')
+        for icol, col in enumerate(columns):
+            matrix[:, icol] = _column_values(dataset, col)
+        return _read_only(matrix)
+    return cached(path, ('features', columns), build)
+
+
+def feature_frame(columns, path=DATASET_FILE):
+    """Read-only DataFrame of the given dataset columns"""
+    columns = tuple(columns)
+
+    def build():
+        return pd.DataFrame(feature_matrix(columns, path), columns=list(columns),
+                            copy=False)
+    return cached(path, ('frame', columns), build)
+
+
+def feature_index(columns, path=DATASET_FILE):
+    """BoxIndex over the given dataset columns for the neighbour queries"""
+    columns = tuple(columns)
+    return cached(path, ('index', columns), lambda: BoxIndex(feature_matrix(columns, path)))
+
+
+def target_vector(column, path=DATASET_FILE):
+    """Read-only (nsim, 1) float64 array of a physical parameter"""
+    def build():
+        store = column_store(path)
+        if store is not None:
+            return store.column(column).reshape(-1, 1)
+        return _read_only(_column_values(load_dataset(path), column).reshape(-1, 1))
+    return cached(path, ('target', column), build)
+
+
+def parameter_unit(column, path=DATASET_FILE):
+    """Unit of a column of the simulation dataset"""
+    store = column_store(path)
+    if store is not None:
+        return store.unit(column)
+    return load_dataset(path)[column].unit
+
+
+def load_hyperparameters(path=HYPERPARAMETERS_FILE):
+    """Table with the hyperparameters of the trained models"""
+    def build():
+        from astropy.table import Table
+        return Table.read(path, format='ascii.csv')
+    return cached(path, 'table', build)
+
+
+def model_index(parameter, path=HYPERPARAMETERS_FILE):
+    """Row of the hyperparameters table (and trained model) of a parameter"""
+    hyp_tab = load_hyperparameters(path)
+    return int(np.where(hyp_tab['Parameter'] == parameter)[0][0])
+
+
+def convert_dataset(path=DATASET_FILE):
+    """Convert a dataset to its column store"""
+    return convert(path, columns_dir(path), file_digest(path))
+
+
+def load_models(path=MODELS_FILE):
+    """List of trained MLPRegressor models with all the FIR lines"""
+    def build():
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+    return cached(path, 'models', build)
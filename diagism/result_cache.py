@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache of the results of the pages, keyed on the content of the request.
+
+A rerun of Streamlit after an unrelated widget changed, or the same catalogue
+uploaded again, finds the predictions, the quantile table and its CSV rows of
+the previous run instead of recomputing the mocks. The key hashes the input
+values, the settings of the mocks, the predicted parameters and the model,
+together with the digests of the data files, so results are never reused with
+other models. Entries live in a process-wide LRU bounded in bytes and, when
+the DIAGISM_RESULT_CACHE environment variable names a directory, on disk.
+The intermediate stages of the pipeline are kept in a separate LRU, only in
+memory, with keys chained from the keys of the stages they depend on.
+@author: Andres Felipe Ramos Padilla
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from diagism.resources import (DATASET_FILE, HYPERPARAMETERS_FILE, MODELS_FILE, atomic_write,
+                               evict_lru, file_digest, mark_used)
+
+CACHE_ENV = 'DIAGISM_RESULT_CACHE'
+MEMORY_SIZE = 256 << 20
+DISK_SIZE = 1 << 30
+# Intermediate stages of the pipeline (neighbour statistics, mocks, predictions)
+STAGES_SIZE = 512 << 20
+
+
+def result_key(values, index, columns, parameters, model, sigma, seed, nrows,
+               tolerance=None, dtype='float64'):
+    """Content hash of a prediction request"""
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    digest = hashlib.sha256()
+    digest.update(values.tobytes())
+    settings = {'shape': values.shape, 'index': [str(idx) for idx in index],
+                'columns': list(columns), 'parameters': list(parameters), 'model': model,
+                'sigma': sigma, 'seed': seed, 'nrows': nrows, 'tolerance': tolerance,
+                'dtype': dtype,
+                'files': [file_digest(path) for path in (DATASET_FILE, MODELS_FILE,
+                                                         HYPERPARAMETERS_FILE)]}
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def stage_key(stage, *inputs):
+    """Content hash of an intermediate stage and the inputs it depends on.
+
+    inputs are arrays, hashed with their shape and dtype, the keys of earlier
+    stages, or values that can be written as JSON.
+    """
+    digest = hashlib.sha256(stage.encode())
+    for value in inputs:
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            digest.update(json.dumps([value.shape, value.dtype.str]).encode())
+            digest.update(value.tobytes())
+        else:
+            digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def entry_size(entry):
+    """Approximate memory of a cached entry in bytes"""
+    size = 0
+    for value in entry.values():
+        if isinstance(value, dict):
+            size += entry_size(value)
+        elif isinstance(value, np.ndarray):
+            size += value.nbytes
+        elif isinstance(value, list):
+            size += sum(np.asarray(item).nbytes for item in value)
+        elif isinstance(value, pd.DataFrame):
+            size += int(value.memory_usage(deep=True).sum())
+        elif isinstance(value, bytes):
+            size += len(value)
+    return size
+
+
+class ResultCache:
+    """LRU of results bounded in bytes, optionally persisted in a directory"""
+
+    def __init__(self, memory_size=MEMORY_SIZE, directory=None, disk_size=DISK_SIZE):
+        self.memory_size = memory_size
+        self.directory = directory
+        self.disk_size = disk_size
+        self._memory = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def _remember(self, key, entry):
+        size = entry_size(entry)
+        with self._lock:
+            if key in self._memory:
+                self._used -= self._memory.pop(key)[1]
+            if size > self.memory_size:
+                return
+            self._memory[key] = (entry, size)
+            self._used += size
+            while self._used > self.memory_size:
+                self._used -= self._memory.popitem(last=False)[1][1]
+
+    def get(self, key):
+        """Cached entry of a key, or None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][0]
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                entry = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        mark_used(path)
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """Save a dict of results (arrays, DataFrames, bytes...) under key"""
+        self._remember(key, entry)
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self._path(key), lambda file: pickle.dump(entry, file))
+        self.evict()
+
+    def get_or_compute(self, key, compute):
+        """Cached entry of key, computed with compute() and saved when missing"""
+        entry = self.get(key)
+        if entry is None:
+            entry = compute()
+            self.put(key, entry)
+        return entry
+
+    def evict(self):
+        """Remove the least recently used results until the directory fits on disk"""
+        evict_lru(self.directory, self.disk_size)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._used = 0
+
+
+_DEFAULT = None
+_STAGES = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_cache():
+    """Cache shared by all the sessions of the process"""
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = ResultCache(directory=os.environ.get(CACHE_ENV) or None)
+        return _DEFAULT
+
+
+def default_stages():
+    """In-memory cache of the intermediate stages, shared by all the sessions"""
+    global _STAGES
+    with _DEFAULT_LOCK:
+        if _STAGES is None:
+            _STAGES = ResultCache(STAGES_SIZE)
+        return _STAGES
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP prediction service, run as python -m diagism serve [--port 8000]
+
+    POST /predict?parameter=SFR&model=eight&sigma=0.2
+        body: CSV with the format of the CSV information page, or JSON, either
+        a list of galaxies ({"z": 0.3, "Lum_CII_158": 8.0, ...}) or an object
+        {"galaxies": [...], "parameter": [...], "model": ..., "sigma": ...}.
+        Answers JSON, or the CSV file of the web app with Accept: text/csv.
+    GET /health
+    GET /metrics  queue depth, batches and latency percentiles, as JSON
+
+Models, scalers and neighbour indices are loaded once per combination of
+settings and shared by all the requests; the MAX_PREDICTORS most recently used
+combinations are kept. Requests with the same settings that
+arrive within batch_wait seconds are predicted together in a single call.
+Every galaxy draws its mocks from the stream of its row in its own request
+(as Predictor with galaxy_seeds), so a result does not depend on the other
+requests of its batch.
+@author: Andres Felipe Ramos Padilla
+"""
+import asyncio
+import io
+import json
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from diagism import output
+from diagism.api import Predictor
+from diagism.columns import DICT_PAR
+from diagism.ingest import Ingestion, validate_header
+from diagism.pipeline import MODELS
+
+BATCH_WAIT = 0.01
+MAX_BATCH = 5000
+MAX_BODY = 64 << 20
+LATENCY_WINDOW = 1000
+MAX_PREDICTORS = 16
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _records(body):
+    """Galaxies and settings of a JSON body"""
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise HTTPError(400, 'Invalid JSON: %s' % e)
+    settings = {}
+    if isinstance(data, dict):
+        settings = {key: value for key, value in data.items() if key != 'galaxies'}
+        data = data.get('galaxies')
+    if not isinstance(data, list) or not data or not all(isinstance(row, dict)
+                                                         for row in data):
+        raise HTTPError(400, 'The body has no list of galaxies')
+    try:
+        columns = validate_header(sorted({key for row in data for key in row}))
+        df = pd.DataFrame.from_records(data).reindex(columns=columns)
+        df = df.apply(pd.to_numeric, errors='raise').astype(np.float64)
+    except (ValueError, TypeError) as e:
+        raise HTTPError(400, str(e))
+    return df, settings, []
+
+
+def _catalogue(body):
+    """Galaxies of a CSV body, and the rejected rows"""
+    ingestion = Ingestion(io.BytesIO(body))
+    try:
+        df = ingestion.read()
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    if not len(df):
+        raise HTTPError(400, 'The CSV body has no valid rows')
+    return df, {}, [error._asdict() for error in ingestion.errors]
+
+
+def _settings(query, body_settings):
+    """(parameters, model, sigma) of a request, from the query and the JSON body"""
+    parameters = body_settings.get('parameter') or []
+    if isinstance(parameters, str):
+        parameters = [parameters]
+    for value in query.get('parameter', []):
+        parameters.extend(param.strip() for param in value.split(','))
+    parameters = list(dict.fromkeys(parameters)) or ['SFR']
+    unknown = [param for param in parameters if param not in DICT_PAR]
+    if unknown:
+        raise HTTPError(400, 'Unknown parameters %s, use some of %s' % (unknown,
+                                                                      list(DICT_PAR)))
+    model = query.get('model', [body_settings.get('model', 'eight')])[0]
+    if model not in MODELS:
+        raise HTTPError(400, 'Unknown model %r, use one of %s' % (model, MODELS))
+    try:
+        sigma = float(query.get('sigma', [body_settings.get('sigma', 0.2)])[0])
+    except (TypeError, ValueError):
+        raise HTTPError(400, 'sigma must be a number')
+    return tuple(parameters), model, sigma
+
+
+class PredictionService:
+    """Micro-batching of the prediction requests over shared Predictors"""
+
+    def __init__(self, batch_wait=BATCH_WAIT, max_batch=MAX_BATCH, threads=1,
+                 max_predictors=MAX_PREDICTORS):
+        self.batch_wait = batch_wait
+        self.max_batch = max_batch
+        self.max_predictors = max_predictors
+        # Inference uses all the cores through numpy, loading may train models
+        self._executor = ThreadPoolExecutor(threads)
+        self._loader = ThreadPoolExecutor(2)
+        self._predictors = OrderedDict()
+        self._pending = {}
+        self.queued = 0
+        self.running = 0
+        self.requests = 0
+        self.galaxies = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+
+    async def predictor(self, key):
+        """Predictor of a combination of settings, loaded once while it is in use"""
+        if key in self._predictors:
+            self._predictors.move_to_end(key)
+        else:
+            parameters, model, columns, sigma = key
+            loop = asyncio.get_running_loop()
+            self._predictors[key] = loop.run_in_executor(
+                self._loader, lambda: Predictor(list(parameters), model, list(columns), sigma,
+                                                galaxy_seeds=True))
+            # The requests waiting for an evicted Predictor still get it
+            while len(self._predictors) > self.max_predictors:
+                self._predictors.popitem(last=False)
+        try:
+            return await asyncio.shield(self._predictors[key])
+        except Exception:
+            self._predictors.pop(key, None)
+            raise
+
+    def submit(self, key, df):
+        """Future with the (table, missing) of df, predicted with the next batch"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((df, future))
+        self.queued += len(df)
+        if sum(len(item[0]) for item in batch) >= self.max_batch:
+            self._flush(key)
+        elif len(batch) == 1:
+            loop.call_later(self.batch_wait, self._flush, key)
+        return future
+
+    def _flush(self, key):
+        batch = self._pending.pop(key, None)
+        if batch:
+            asyncio.ensure_future(self._run(key, batch))
+
+    async def _run(self, key, batch):
+        ngal = sum(len(df) for df, _ in batch)
+        self.queued -= ngal
+        self.running += ngal
+        try:
+            predictor = await self.predictor(key)
+            frames = [df.reset_index(drop=True) for df, _ in batch]
+            rows = np.concatenate([np.arange(len(df)) for df in frames])
+            loop = asyncio.get_running_loop()
+            table, missing = await loop.run_in_executor(
+                self._executor, predictor.predict, pd.concat(frames, ignore_index=True),
+                None, rows)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.running -= ngal
+        self.batches += 1
+        start = 0
+        for df, future in batch:
+            part = table.iloc[start:start+len(df)].set_axis(df.index)
+            part_missing = missing[(missing >= start) & (missing < start+len(df))] - start
+            if not future.done():
+                future.set_result((part, part_missing))
+            start += len(df)
+
+    async def predict(self, method, target, headers, body):
+        """(status, content type, body) of an HTTP request"""
+        url = urlsplit(target)
+        if url.path == '/health':
+            return 200, 'application/json', json.dumps({'status': 'ok'}).encode()
+        if url.path == '/metrics':
+            return 200, 'application/json', json.dumps(self.metrics()).encode()
+        if url.path != '/predict':
+            raise HTTPError(404, 'Unknown path %s' % url.path)
+        if method != 'POST':
+            raise HTTPError(405, 'Use POST to predict')
+        start = time.perf_counter()
+        if 'csv' in headers.get('content-type', ''):
+            df, body_settings, rejected = _catalogue(body)
+        else:
+            df, body_settings, rejected = _records(body)
+        parameters, model, sigma = _settings(parse_qs(url.query), body_settings)
+        key = (parameters, model, tuple(df.columns), sigma)
+        try:
+            predictor = await self.predictor(key)
+        except (KeyError, ValueError) as e:
+            raise HTTPError(400, e.args[0] if e.args else str(e))
+        table, missing = await self.submit(key, df)
+        self.requests += 1
+        self.galaxies += len(df)
+        self.latencies.append(time.perf_counter() - start)
+        if 'text/csv' in headers.get('accept', ''):
+            return 200, 'text/csv', predictor.header() + output.csv_rows(table)
+        answer = {'parameters': list(parameters), 'model': predictor.description,
+                  'units': [str(target.unit) for target in predictor.targets],
+                  'scores': [target.score for target in predictor.targets],
+                  'results': json.loads(table.rename_axis('id').reset_index().to_json(
+                      orient='records')),
+                  'missing': [int(igal) for igal in missing], 'rejected': rejected}
+        return 200, 'application/json', json.dumps(answer).encode()
+
+    def metrics(self):
+        latencies = np.array(self.latencies) if self.latencies else np.full(1, np.nan)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {'uptime_seconds': time.time() - self.started,
+                'queue_depth': self.queued, 'running': self.running,
+                'requests': self.requests, 'galaxies': self.galaxies,
+                'batches': self.batches, 'errors': self.errors,
+                'galaxies_per_batch': self.galaxies / self.batches if self.batches else None,
+                'latency_seconds': {'p50': None if np.isnan(p50) else p50,
+                                    'p95': None if np.isnan(p95) else p95,
+                                    'p99': None if np.isnan(p99) else p99},
+                'predictors': len(self._predictors)}
+
+    async def handle(self, reader, writer):
+        """Answer one HTTP request on a connection"""
+        try:
+            try:
+                request = (await reader.readline()).decode('latin-1').split()
+                if len(request) != 3:
+                    raise HTTPError(400, 'Malformed request line')
+                method, target, _ = request
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode('latin-1').strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = b''
+                if method == 'POST':
+                    if 'content-length' not in headers:
+                        raise HTTPError(411, 'Content-Length is required')
+                    try:
+                        length = int(headers['content-length'])
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        raise HTTPError(400, 'Content-Length must be a non-negative integer')
+                    if length > MAX_BODY:
+                        raise HTTPError(413, 'The body is larger than %i bytes' % MAX_BODY)
+                    body = await reader.readexactly(length)
+                status, content_type, answer = await self.predict(method, target, headers,
+                                                                  body)
+            except HTTPError as e:
+                self.errors += 1
+                status, content_type = e.status, 'application/json'
+                answer = json.dumps({'error': str(e)}).encode()
+            except Exception as e:
+                self.errors += 1
+                status, content_type = 500, 'application/json'
+                answer = json.dumps({'error': '%s: %s' % (type(e).__name__, e)}).encode()
+            writer.write(('HTTP/1.1 %i %s\r\nContent-Type: %s\r\nContent-Length: %i\r\n'
+                          'Connection: close\r\n\r\n' % (status, REASONS[status], content_type,
+                                                         len(answer))).encode('latin-1'))
+            writer.write(answer)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        self._loader.shutdown(wait=False)
+
+
+async def serve(host='127.0.0.1', port=8000, log=print, **kwargs):
+    """Run the prediction service until cancelled"""
+    service = PredictionService(**kwargs)
+    server = await asyncio.start_server(service.handle, host, port)
+    if log is not None:
+        log('DiagISM prediction service on http://%s:%i' % (host, port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.shutdown()
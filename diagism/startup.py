@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Start-up of the web app: warm-up in the background and import times.
+
+main.py only imports the module of a page when the page is selected, so the
+Home page renders without loading the models, astropy or sklearn. After the first
+render, a daemon thread loads the neighbour index, the scalers and the eight
+FIR lines models, and imports the pages, so the first prediction does not pay
+for them. The warm-up runs once per process and is disabled by setting the
+DIAGISM_WARMUP environment variable to 0.
+The import time of every module is reported with
+python -m diagism import-times [module ...]
+@author: Andres Felipe Ramos Padilla
+"""
+import importlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+WARMUP_ENV = 'DIAGISM_WARMUP'
+PAGES = ('pages.csv_information', 'pages.reg_model8', 'pages.reg_model2')
+_IMPORTTIME = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)')
+
+_WARMUP = None
+_WARMUP_LOCK = threading.Lock()
+
+
+def warm_up(log=None):
+    """Load the data, scalers and models shared by the pages, and import the pages"""
+    from diagism.artifacts import load_artifacts
+    from diagism.columns import COL_ANALT, DICT_PAR
+    from diagism.engine import eight_lines_engine
+    from diagism.resources import feature_index, parameter_unit
+
+    steps = [('pages', lambda: [importlib.import_module(page) for page in PAGES]),
+             ('neighbour index', lambda: feature_index(COL_ANALT)),
+             ('scalers', load_artifacts)]
+    for param, column in DICT_PAR.items():
+        steps.append((param, lambda column=column: (eight_lines_engine(column),
+                                                    parameter_unit(column))))
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            # The page reports the error when it needs the missing file
+            if log is not None:
+                log('warm-up of %s failed: %s' % (name, e))
+            continue
+        if log is not None:
+            log('warm-up of %s: %.2f s' % (name, time.perf_counter() - start))
+
+
+def start_warm_up(log=None):
+    """Run warm_up in a daemon thread, once per process.
+
+    Returns the thread, or None when the warm-up is disabled.
+    """
+    global _WARMUP
+    if os.environ.get(WARMUP_ENV, '1') == '0':
+        return None
+    with _WARMUP_LOCK:
+        if _WARMUP is None:
+            _WARMUP = threading.Thread(target=warm_up, args=(log,), name='diagism-warm-up',
+                                       daemon=True)
+            _WARMUP.start()
+        return _WARMUP
+
+
+def import_times(modules=PAGES):
+    """{module: (self seconds, cumulative seconds)} of importing modules in a new interpreter"""
+    code = ''.join('import %s\n' % module for module in modules)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            times[match.group(3)] = (int(match.group(1)) / 1e6, int(match.group(2)) / 1e6)
+    return times
+
+
+def package_times(times):
+    """Self time of the imports grouped by top-level package, slowest first"""
+    packages = {}
+    for module, (own, _) in times.items():
+        package = module.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + own
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def import_report(modules=PAGES, top=20):
+    """Text report of the slowest packages and modules to import"""
+    times = import_times(modules)
+    total = sum(own for own, _ in times.values())
+    lines = ['Importing %s: %.3f s in %i modules' % (', '.join(modules), total, len(times)),
+             '', '%-40s %10s' % ('package', 'self [s]')]
+    lines += ['%-40s %10.3f' % item for item in package_times(times)[:top]]
+    lines += ['', '%-40s %10s %12s' % ('module', 'self [s]', 'cumulative')]
+    slowest = sorted(times.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    lines += ['%-40s %10.3f %12.3f' % (module, own, cumulative)
+              for module, (own, cumulative) in slowest]
+    return '\n'.join(lines)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Training of the models with a selection of FIR lines.
+@author: Andres Felipe Ramos Padilla
+"""
+import hashlib
+from ast import literal_eval
+
+from diagism.artifacts import x_scaler, y_scaler
+from diagism.columns import COL_ANALT
+from diagism.resources import (feature_matrix, target_vector, model_index,
+                               load_hyperparameters)
+
+
+def canonical_columns(columns):
+    """Feature columns in the order used to train the models (redshift last)"""
+    unknown = set(columns) - set(COL_ANALT)
+    if unknown:
+        raise KeyError('Unknown feature columns: %s' % sorted(unknown))
+    return [col for col in COL_ANALT if col in columns]
+
+
+def hyperparameters(parameter):
+    """Hyperparameters of the model of a physical parameter"""
+    hyp_tab = load_hyperparameters()
+    row = hyp_tab[model_index(parameter)]
+    return {'hidden_layer_sizes': literal_eval(row['hidden_layer_sizes']),
+            'activation': str(row['activation']),
+            'alpha': float(row['alpha']),
+            'batch_size': int(row['batch_size']),
+            'learning_rate_init': float(row['learning_rate_init']),
+            'max_iter': int(row['max_iter'])}
+
+
+def hyperparameters_hash(parameter):
+    """Short hash identifying the hyperparameters of a physical parameter"""
+    return hashlib.sha256(repr(sorted(hyperparameters(parameter).items())).encode()
+                          ).hexdigest()[:16]
+
+
+def train_model(columns, parameter, verbose=True):
+    """Train the model of a parameter with the given feature columns.
+
+    Returns the fitted MLPRegressor and its score (R^2) on the simulation
+    dataset. The columns must be in canonical order.
+    """
+    from sklearn.neural_network import MLPRegressor
+    scalerx = x_scaler(columns)
+    scalery = y_scaler(parameter)
+    x_scale = scalerx.transform(feature_matrix(columns))
+    y_scale = scalery.transform(target_vector(parameter))
+    regr_mlp = MLPRegressor(random_state=42, verbose=verbose, solver='adam',
+                            **hyperparameters(parameter))
+    regr_mlp.fit(x_scale, y_scale.ravel())
+    return regr_mlp, regr_mlp.score(x_scale, y_scale)
@@ -5,9 +5,16 @@ File to run the web app for DiagISM.
 Run as python -m streamlit run main.py
 @author: Andres Felipe Ramos Padilla
 """
+import importlib
+
 import streamlit as st
 
-from pages import reg_model2, reg_model8, csv_information
+from diagism.startup import start_warm_up
+
+# Page modules are only imported when their page is first selected
+PAGES = {'Model with selected FIR lines': 'pages.reg_model2',
+         'Model with 8 FIR Lines': 'pages.reg_model8',
+         'CSV files information': 'pages.csv_information'}
 
 # Info page
 st.set_page_config(page_title="DiagISM app", page_icon="files/logo_DiagISM.png")
@@ -53,7 +60,7 @@ def main():
         Please acknowledge these papers if you have used this web app.""")
         st.write("## Usage web app")
         st.markdown(""" 
-        This web app is an easy-to-use environment for researchers (and curious people) to estimate and retrieve physical ISM parameters that we would expect in galaxies given the luminosities of the main FIR emission lines (between 10$^{2}$ and 10$^{10}$ Lsun). Two different models are available to obtain the estimates: One model uses all the information of the eight luminosities of the FIR lines and the other uses the information of the FIR lines selected by the user. The web app allows to predict one ISM physical parameter at a time from the following list
+        This web app is an easy-to-use environment for researchers (and curious people) to estimate and retrieve physical ISM parameters that we would expect in galaxies given the luminosities of the main FIR emission lines (between 10$^{2}$ and 10$^{10}$ Lsun). Two different models are available to obtain the estimates: One model uses all the information of the eight luminosities of the FIR lines and the other uses the information of the FIR lines selected by the user. The web app allows to predict one or several ISM physical parameters at a time (using the same mock values) from the following list
 * Star Formation Rate (SFR) [Msun/yr]
 * Metallicity [Z/Zsun]
 * Neutral cloud density [cm$^{-3}$]
@@ -64,17 +71,15 @@ def main():
 * Gas mass [Msun]
 The estimated information can then be retrieved in a CSV file format that can be used for future research.""")
 
-    if analysis_type == 'Model with selected FIR lines':
-        reg_model2.page()
-    elif analysis_type == 'Model with 8 FIR Lines':
-        reg_model8.page()
-    elif analysis_type == 'CSV files information':
-        csv_information.page()
+    if analysis_type in PAGES:
+        importlib.import_module(PAGES[analysis_type]).page()
     
     lcol, centcol, rcol = st.columns([1, 2, 1])
     centcol.caption("""
         Andrés Felipe Ramos Padilla - Oct 2022.
         """)
+    # Loads the models of the pages once the first page is on screen
+    start_warm_up()
 
 
 if __name__ == '__main__':
@@ -4,10 +4,21 @@
 This file contains the definitions for the web app for DiagISM.
 @author: Andres Felipe Ramos Padilla
 """
+import time
+
 import streamlit as st
 import numpy as np
 import pandas as pd
 
+from diagism import adaptive, formats
+from diagism.grid import available_grids
+from diagism.ingest import Ingestion
+from diagism.instrument import StageTimer
+from diagism.jobs import default_queue
+from diagism.model_store import default_store
+from diagism.pipeline import Pipeline, input_values
+
+
 def user_input_features():
     """Obtaining user defined values"""
     reds = st.sidebar.slider('Redshift', 0, 6, 2)
@@ -38,66 +49,245 @@ def user_input_features():
     return pd.DataFrame(data, index=['User values'])[options]
 
 
+def read_upload(uploaded_file):
+    """Validated catalogue of an uploaded CSV file, reporting the rejected rows"""
+    ingestion = Ingestion(uploaded_file)
+    try:
+        df_user = ingestion.read()
+    except ValueError as e:
+        st.exception(e)
+        st.stop()
+    if ingestion.nrejected:
+        st.warning('%i of the %i rows of the file were rejected and are not predicted.'
+                   % (ingestion.nrejected, ingestion.nrows))
+        st.dataframe(ingestion.error_table())
+    if not len(df_user):
+        st.error('The CSV file has no valid rows.')
+        st.stop()
+    return df_user
+
+
 def user_parameter():
     """Obtaining user defined parameters"""
     options = st.sidebar.multiselect(
-        'Parameter to predict',
+        'Parameters to predict',
         ['SFR', 'ISRF', 'Metallicity', 'Pressure', 'Density',
          'Neutral cloud size', 'Gas Mass', 'Stellar Mass'],
         ['SFR'])
-    if len(options) > 1:
-        st.error('(Currently) Only one parameter can be predicted at a time.')
-        st.stop()
     if len(options) < 1:
         st.sidebar.error('Choose at least one parameter')
         st.stop()
     return options
 
 
-def create_mocks(values, features, sys_error=False):
-    """Create mock values to estimate the error on the prediction"""
+def user_score(parameter, score_mlp):
+    """Show the score of the predictions of a parameter and tell whether it is usable"""
+    st.write('Score of the predictions (%s): %1.3f' % (parameter, score_mlp))
+    if score_mlp <= 0.7:
+        st.error(
+            'The score is not good enough to make a prediction with this parameter')
+        return False
+    if np.logical_and(score_mlp > 0.7, score_mlp < 0.9):
+        st.warning(
+            'Score for this parameter may not be the best for the prediction.')
+    return True
+
+
+def stage_timer():
+    """Timer of the stages of a page, measuring the memory in debug mode"""
+    debug = st.sidebar.checkbox('Show the time and memory of each stage', False)
+    return StageTimer(trace_memory=debug)
+
+
+def report_timings(timer, **context):
+    """Show the stages in the sidebar in debug mode, and export them"""
+    if timer.trace_memory:
+        st.sidebar.write('Time [s] and peak memory [MB] of each stage')
+        st.sidebar.dataframe(timer.table())
+    timer.export(**context)
+
+
+def user_sigma(sys_error=False):
+    """Obtaining the assumed error of the luminosities"""
     if sys_error:
-        sigma = 0.2
+        return 0.2
+    return st.sidebar.slider('Assumed error [dex]', 0.05, 1.0, 0.2, 0.05)
+
+
+def user_tolerance():
+    """Obtaining the tolerance of the adaptive number of mocks, None for a fixed number"""
+    if not st.sidebar.checkbox('Adaptive number of mocks', False,
+                               help='Draw mocks until the percentiles of every galaxy '
+                                    'are stable, instead of 2000 mocks per galaxy'):
+        return None
+    return st.sidebar.slider('Tolerance (fraction of the 16th-84th interval)',
+                             0.005, 0.1, adaptive.TOLERANCE, 0.005)
+
+
+def user_dtype():
+    """Obtaining the precision of the mocks and predictions"""
+    single = st.sidebar.checkbox('Single precision (float32)', False,
+                                 help='Halves the memory of the mocks; the percentiles '
+                                      'differ by less than 0.001 from double precision')
+    return np.float32 if single else np.float64
+
+
+def user_grids():
+    """Obtaining whether the precomputed grids are used for the single galaxy mode"""
+    if not available_grids():
+        return False
+    return st.sidebar.checkbox('Use the precomputed grids', True,
+                               help='Interpolate the results of the sidebar values in a '
+                                    'precomputed grid instead of computing the mocks')
+
+
+def galaxy_results(pipeline, values, galaxy_ids=None):
+    """Results of the pipeline for the galaxies, with the settings of the sidebar.
+
+    Reports the description of the mocks and the galaxies without similar
+    simulated galaxies; see Pipeline.run for the results.
+    """
+    tolerance = user_tolerance()
+    # The sidebar values of a single galaxy can be interpolated in a grid
+    grids = galaxy_ids is None and tolerance is None and len(values) == 1 and user_grids()
+    run = pipeline.run(values, galaxy_ids, tolerance, grids)
+    if run['mocks_note'] is not None:
+        st.write(run['mocks_note'])
+    for igal in run['missing']:
+        st.info("""No luminosity values in the simulation dataset similar to the input
+        (Galaxy row %s). Using the average of the input luminosities."""%igal)
+    return run
+
+
+# Bin rules of astropy.visualization.hist and their numpy names
+BIN_RULES = {'scott': 'scott', 'freedman': 'fd'}
+
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def galaxy_histogram(predictions, bins='scott'):
+    """Density histogram of the predictions of one galaxy, as (edges, density)"""
+    edges = np.histogram_bin_edges(predictions, bins=BIN_RULES.get(bins, bins))
+    density, edges = np.histogram(predictions, bins=edges, density=True)
+    return edges, density
+
+
+def plot_galaxies(predictions, table, unit, bins='scott', key=None):
+    """Histogram of the predictions of a galaxy chosen by the user.
+
+    Nothing is computed until a galaxy is asked for, and the histograms are
+    cached, so the plots do not slow down the predictions nor the reruns.
+    """
+    if predictions is None:
+        st.caption('The histograms are not available for results interpolated in a '
+                   'precomputed grid')
+        return
+    if not st.checkbox('Plot the predictions of a galaxy', key='plot_%s' % key):
+        return
+    gal = st.selectbox('Galaxy', range(len(predictions)), key='galaxy_%s' % key,
+                       format_func=lambda igal: str(table.index[igal]))
+    edges, density = galaxy_histogram(np.asarray(predictions[gal]), bins)
+    stats = table.iloc[gal]
+    rules = [{'value': stats['median'], 'statistic': 'median'},
+             {'value': stats['mean'], 'statistic': 'mean'},
+             {'value': stats['per_16th'], 'statistic': '16th and 84th percentiles'},
+             {'value': stats['per_84th'], 'statistic': '16th and 84th percentiles'}]
+    histogram = pd.DataFrame({'start': edges[:-1], 'end': edges[1:], 'density': density})
+    st.vega_lite_chart(histogram, {
+        'title': 'Galaxy %s' % table.index[gal],
+        'layer': [
+            {'mark': {'type': 'bar', 'opacity': 0.5},
+             'encoding': {
+                 'x': {'field': 'start', 'type': 'quantitative', 'bin': {'binned': True},
+                       'title': 'Estimated parameter value [%s]' % unit},
+                 'x2': {'field': 'end'},
+                 'y': {'field': 'density', 'type': 'quantitative', 'title': 'Density'}}},
+            {'data': {'values': rules},
+             'mark': {'type': 'rule', 'strokeWidth': 2},
+             'encoding': {
+                 'x': {'field': 'value', 'type': 'quantitative'},
+                 'color': {'field': 'statistic', 'type': 'nominal', 'title': None}}}]},
+        use_container_width=True)
+
+
+def trained_model(columns, parameter):
+    """Trained (model, score) of the selected lines, following its training job"""
+    store = default_store()
+    entry = store.get(columns, parameter)
+    if entry is not None:
+        return entry
+    job = default_queue().submit(columns, parameter)
+    if job is None:
+        return store.get(columns, parameter)
+    # A rerun stops this loop but not the job, which the next run attaches to
+    progress = st.progress(0.0, text='Estimating the best values for the physical parameter')
+    while not job.done():
+        fraction = job.fraction()
+        progress.progress(fraction, text='Training the model: iteration %i, loss = %.5f' % (
+            job.iteration, job.loss))
+        time.sleep(0.5)
+    progress.empty()
+    return job.result()
+
+
+def download_results(run, metadata):
+    """Download button of the results, in the format chosen by the user"""
+    _, col2, _ = st.columns(3)
+    fmt = col2.selectbox('File format', formats.available_formats(),
+                         format_func=lambda fmt: fmt.upper().replace('.GZ', ' (gzip)'))
+    predictions = run['predictions']
+    # Grid results have no samples, and FITS needs the same number of mocks per galaxy
+    can_sample = fmt in formats.SAMPLE_FORMATS and all(
+        pred is not None and (fmt == 'parquet' or isinstance(pred, np.ndarray))
+        for pred in predictions.values())
+    samples = can_sample and col2.checkbox('Include the prediction of every mock', False)
+    if fmt == 'csv':
+        # The CSV rows of the results are already encoded
+        data = metadata.csv_header() + run['csv']
     else:
-        sigma = st.sidebar.slider('Assumed error [dex]', 0.05, 1.0, 0.2, 0.05)
-    nlines = values.shape[1]
-    np.random.seed(42)
-    nrows = 2000
-    rows = np.zeros((values.shape[0], nrows, nlines))
-    for igal in range(values.shape[0]):
-        loc_cols = np.unique(np.where(~np.isnan(values[igal]))[0])[:-1]
-        cond1 = (features[features.columns[loc_cols]] <= values[igal][loc_cols]+sigma).all(axis=1)
-        cond2 = (features[features.columns[loc_cols]] >= values[igal][loc_cols]-sigma).all(axis=1)
-        info = features[cond1 & cond2].describe()
-        if info.isnull().values.any():
-            st.info("""No luminosity values in the simulation dataset similar to the input
-            (Galaxy row %s). Using the average of the input luminosities."""%igal)
-            bad_sol = pd.DataFrame([values[igal]]).describe()
-            bad_sol.loc['mean'] = np.nanmean(values[igal][:-1])
-            bad_sol.loc['std'] = max(np.nanstd(values[igal][:-1]), 0.05)
-            info = bad_sol
-        for col in range(nlines):
-            sigma2 = np.sqrt(sigma**2 + info.loc['std'][col]**2)
-            rand_lum = np.random.normal(info.loc['mean'][col], sigma2, nrows)
-            if ~np.isnan(values[igal][col]):
-                if col == nlines-1:
-                    # Redshift does not change
-                    rows[igal, :, col] = values[igal][col]
-                else:
-                    if sys_error:
-                        rows[igal, :, col] = np.random.normal(
-                            values[igal][col], sigma, nrows)
-                    else:
-                        rows[igal, :, col] = np.random.normal(
-                            values[igal][col], 0.01, nrows)
-            else:
-                rows[igal, :, col] = rand_lum
-    return rows
-
-
-@st.cache
-def convert_df(dataframe):
-    """Convert dataframe to csv file"""
-    # IMPORTANT: Cache the conversion to prevent computation on every rerun
-    head_inf = "The data was generated in DiagSIM with ..."
-    return dataframe.to_csv(header=head_inf, index_label='id').encode('utf-8')
+        data = formats.encode(fmt, run['table'], metadata, predictions if samples else None)
+    extension, mime = formats.FORMATS[fmt]
+    col2.download_button(
+        label="Download results as %s" % fmt.upper().replace('.GZ', ' (gzip)'),
+        data=data,
+        file_name='DiagISM_result' + extension,
+        mime=mime,
+    )
+
+
+def model_page(provider, df_user, uploaded_file, timer, **context):
+    """Scores, predictions, plots and download of the parameters chosen by the user.
+
+    provider gives the models of the page (see diagism.pipeline) and df_user
+    has the user columns of the galaxies; context is exported with the timings.
+    """
+    test_param = user_parameter()
+    st.write('Physical parameters to be predicted: ', ', '.join(test_param))
+    start_time = time.time()
+
+    pipeline = Pipeline(provider, list(df_user.columns), user_sigma(provider.sys_error),
+                        dtype=user_dtype(), timer=timer)
+    for param in test_param:
+        target = pipeline.target(param)
+        if user_score(param, target.score):
+            pipeline.add(target)
+    if not pipeline.targets:
+        st.stop()
+
+    # Uploaded galaxies keep the row of the file, rejected rows are skipped
+    galaxy_ids = None if uploaded_file is None else df_user.index
+    # The same mocks are used for all the parameters
+    run = galaxy_results(pipeline, input_values(df_user, pipeline.user_columns), galaxy_ids)
+    for target in pipeline.targets:
+        if len(pipeline.targets) > 1:
+            st.write('### %s' % target.parameter)
+        with timer.stage('plotting'):
+            plot_galaxies(run['predictions'][target.parameter], run['results'][target.parameter],
+                          target.unit, bins=provider.bins, key=target.parameter)
+    st.write(run['table'])
+    st.success('Results obtained!')
+    st.write("Results took", np.round(
+        time.time() - start_time, 2), "[s] to run")
+    metadata = pipeline.metadata(run['mocks_note'], timer.summary())
+    report_timings(timer, ngal=len(df_user),
+                   parameters=[target.parameter for target in pipeline.targets], **context)
+    download_results(run, metadata)
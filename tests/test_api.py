@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Predictions of the headless API on the example catalogues.
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+
+import pandas as pd
+
+import diagism
+from diagism.api import Predictor
+from diagism.ingest import Ingestion
+
+EXAMPLE = 'files/example_input1.csv'
+
+
+def example_catalogue():
+    with open(EXAMPLE, 'rb') as file:
+        return Ingestion(file).read()
+
+
+def test_predict_galaxy_seeds():
+    df = example_catalogue()
+    table = diagism.predict(df, 'SFR', galaxy_seeds=True)
+    assert list(table.index) == list(df.index)
+    assert np.isfinite(table['median']).any()
+    # Every galaxy has its own stream, so a chunk gives the same results alone
+    part = diagism.predict(df.iloc[:2], 'SFR', galaxy_seeds=True)
+    np.testing.assert_array_equal(part.to_numpy(), table.iloc[:2].to_numpy())
+
+
+def test_predict_workers():
+    df = example_catalogue()
+    single = diagism.predict(df, 'SFR')
+    parallel = diagism.predict(df, 'SFR', workers=2)
+    np.testing.assert_array_equal(single.to_numpy(), parallel.to_numpy())
+
+
+def test_adaptive_chunks():
+    df = example_catalogue()
+    # 20 galaxies, more than a block of mocks.DRAW_GALAXIES
+    df = pd.concat([df + 0.1*shift for shift in range(5)], ignore_index=True)
+    predictor = Predictor('SFR', columns=list(df.columns), tolerance=0.05)
+    table = predictor.predict(df, 0)[0]
+    part = predictor.predict(df.iloc[16:], 16)[0]
+    np.testing.assert_array_equal(part.to_numpy(), table.iloc[16:].to_numpy())
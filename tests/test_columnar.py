@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conversion of the simulation dataset to its column store.
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+
+from diagism.columnar import ColumnStore, convert
+from diagism.columns import COL_ANALT
+from diagism.resources import DATASET_FILE, _column_values, file_digest, load_dataset
+
+
+def test_convert_dataset(tmp_path):
+    convert(DATASET_FILE, str(tmp_path), file_digest(DATASET_FILE))
+    store = ColumnStore(str(tmp_path))
+    dataset = load_dataset()
+    assert store.nrows == len(dataset)
+    assert set(store.manifest['columns']) == set(dataset.colnames)
+    for name in dataset.colnames:
+        if dataset[name].dtype.kind in 'biuf':
+            np.testing.assert_array_equal(store.column(name), _column_values(dataset, name))
+        else:
+            np.testing.assert_array_equal(store.column(name), np.asarray(dataset[name]))
+    features = store.features(COL_ANALT)
+    assert features.flags.f_contiguous
+    for icol, name in enumerate(COL_ANALT):
+        np.testing.assert_array_equal(features[:, icol], _column_values(dataset, name))
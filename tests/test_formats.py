@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Round trip of the result files written chunk by chunk.
+@author: Andres Felipe Ramos Padilla
+"""
+import gzip
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from diagism.formats import Metadata, encode
+
+NGAL = 25
+NMOCKS = 7
+# Three chunks, the last one shorter
+CHUNK_ROWS = 10
+METADATA = Metadata(['SFR'], ['Msun/yr'], [0.9], 'eight')
+
+
+def result_table():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.normal(size=(NGAL, 5)), index=pd.RangeIndex(NGAL, name='id'),
+                        columns=['per_16th', 'median', 'per_84th', 'mean', 'std'])
+
+
+def mock_samples():
+    return {'SFR': np.random.default_rng(1).normal(size=(NGAL, NMOCKS))}
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'csv.gz'])
+def test_csv(fmt):
+    table = result_table()
+    contents = encode(fmt, table, METADATA, chunk_rows=CHUNK_ROWS)
+    if fmt == 'csv.gz':
+        contents = gzip.decompress(contents)
+    lines = contents.decode('utf-8').splitlines()
+    assert lines[0].startswith('# Predictions obtained from DiagISM')
+    header = [line for line in lines if not line.startswith('#')][0]
+    assert header == 'id,per_16th,median,per_84th,mean,std'
+    assert sum(line == header for line in lines) == 1
+    read = pd.read_csv(io.BytesIO(contents), comment='#', index_col='id')
+    pd.testing.assert_frame_equal(read, table, check_index_type=False, rtol=1e-15)
+
+
+def test_parquet():
+    pq = pytest.importorskip('pyarrow.parquet')
+    table, samples = result_table(), mock_samples()
+    contents = encode('parquet', table, METADATA, samples, chunk_rows=CHUNK_ROWS)
+    parquet = pq.ParquetFile(io.BytesIO(contents))
+    assert parquet.metadata.num_row_groups == 3
+    read = parquet.read()
+    info = json.loads(read.schema.metadata[b'diagism'])
+    assert info['parameters'] == ['SFR'] and info['units'] == ['Msun/yr']
+    assert info['model'] == 'eight'
+    assert read.schema.field('median').metadata[b'unit'] == b'Msun/yr'
+    assert read.schema.field('samples').metadata[b'unit'] == b'Msun/yr'
+    assert read.schema.field('id').metadata is None
+    frame = read.to_pandas()
+    np.testing.assert_array_equal(frame['id'], table.index)
+    np.testing.assert_array_equal(frame[table.columns].to_numpy(), table.to_numpy())
+    np.testing.assert_array_equal(np.stack(frame['samples']), samples['SFR'])
+
+
+def test_parquet_adaptive():
+    pq = pytest.importorskip('pyarrow.parquet')
+    table = result_table()
+    ragged = [np.arange(igal % 4 + 1.0) for igal in range(NGAL)]
+    contents = encode('parquet', table, METADATA, {'SFR': ragged}, chunk_rows=CHUNK_ROWS)
+    read = pq.read_table(io.BytesIO(contents)).to_pandas()
+    for values, expected in zip(read['samples'], ragged):
+        np.testing.assert_array_equal(values, expected)
+
+
+def test_fits():
+    from astropy.io import fits
+    table, samples = result_table(), mock_samples()
+    contents = encode('fits', table, METADATA, samples, chunk_rows=CHUNK_ROWS)
+    assert len(contents) % 2880 == 0
+    with fits.open(io.BytesIO(contents)) as hdul:
+        hdu = hdul['DIAGISM']
+        assert hdu.header['NAXIS2'] == NGAL
+        assert hdu.header['PARAM1'] == 'SFR' and hdu.header['UNIT1'] == 'Msun/yr'
+        units = {hdu.header['TTYPE%i' % icol]: hdu.header.get('TUNIT%i' % icol)
+                 for icol in range(1, hdu.header['TFIELDS'] + 1)}
+        assert units == {'id': None, 'per_16th': 'Msun/yr', 'median': 'Msun/yr',
+                         'per_84th': 'Msun/yr', 'mean': 'Msun/yr', 'std': 'Msun/yr',
+                         'samples': 'Msun/yr'}
+        np.testing.assert_array_equal(hdu.data['id'], table.index)
+        for col in table.columns:
+            np.testing.assert_array_equal(hdu.data[col], table[col])
+        np.testing.assert_array_equal(hdu.data['samples'], samples['SFR'])
+
+
+def test_fits_adaptive():
+    ragged = [np.arange(igal % 4 + 1.0) for igal in range(NGAL)]
+    with pytest.raises(ValueError, match='use Parquet for adaptive mocks'):
+        encode('fits', result_table(), METADATA, {'SFR': ragged}, chunk_rows=CHUNK_ROWS)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputed quantile grids against the full computation.
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+import pandas as pd
+
+from diagism.grid import STATS, QuantileGrid, build_grid
+from diagism.pipeline import Pipeline, input_values
+from diagism.result_cache import ResultCache
+
+# In the order of the grid axes, redshift last
+COLUMNS = ['Lum_CII_158', 'z']
+
+
+def full_run(values):
+    pipeline = Pipeline('eight', COLUMNS, memoise=False)
+    pipeline.add(pipeline.target('SFR'))
+    df = pd.DataFrame([values], columns=COLUMNS)
+    run = pipeline.run(input_values(df, pipeline.user_columns), cache=ResultCache())
+    return run['results']['SFR'][list(STATS)].to_numpy()[0]
+
+
+def test_grid_nodes(tmp_path):
+    grid = QuantileGrid(build_grid('eight', COLUMNS, ['SFR'], step=2.0,
+                                   directory=str(tmp_path)))
+    assert grid.usable('eight', COLUMNS, 0.2, ['SFR'])
+    values = [grid.axes[0][2], grid.axes[1][2]]
+    node = grid.lookup(values, ['SFR'])['SFR'].to_numpy()[0]
+    np.testing.assert_allclose(node, full_run(values), rtol=1e-12, atol=0)
+    errors = grid.manifest['interpolation_error']['SFR']
+    assert set(errors) == set(STATS)
+    assert all(np.isfinite(error) for error in errors.values())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Validated reading of the CSV catalogues.
+@author: Andres Felipe Ramos Padilla
+"""
+import io
+
+import numpy as np
+import pytest
+
+from diagism.ingest import Ingestion, RowError, validate_header
+
+
+def csv_file(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+def test_header():
+    assert validate_header(['z', ' Lum_CII_158 ']) == ['Lum_CII_158', 'z']
+    with pytest.raises(ValueError, match='not correct'):
+        validate_header(['Lum_CII_158', 'redshift'])
+    with pytest.raises(ValueError, match='more than once'):
+        validate_header(['z', 'Lum_CII_158', 'z'])
+    with pytest.raises(ValueError, match='no header'):
+        validate_header([''])
+    with pytest.raises(ValueError, match='not correct'):
+        Ingestion(csv_file('Lum_CII,z\n8.1,1.0\n')).read()
+
+
+def test_rejected_rows():
+    text = ('z,Lum_CII_158\n'
+            '1.0,8.1\n'
+            '2.0,eight\n'
+            '3.0,inf\n'
+            '4.0\n'
+            '\n'
+            ',NaN\n'
+            '5.0,\n'
+            '6.0,8.6\n')
+    ingestion = Ingestion(csv_file(text), chunksize=2)
+    df = ingestion.read()
+    assert list(df.columns) == ['Lum_CII_158', 'z']
+    assert list(df.index) == [0, 5, 6]
+    np.testing.assert_array_equal(df['z'], [1.0, 5.0, 6.0])
+    assert np.isnan(df['Lum_CII_158'][5])
+    assert ingestion.nrows == 7
+    assert ingestion.nrejected == 4
+    assert sorted(ingestion.errors) == [RowError(3, 'Lum_CII_158', 'eight', 'not a number'),
+                                        RowError(4, 'Lum_CII_158', 'inf', 'not finite'),
+                                        RowError(5, None, None, 'expected 2 fields, found 1'),
+                                        RowError(7, None, None, 'no values')]
+    assert list(ingestion.error_table().columns) == list(RowError._fields)
+
+
+def test_max_errors():
+    text = 'z,Lum_CII_158\n' + '1.0,x\n' * 5
+    ingestion = Ingestion(csv_file(text), max_errors=2)
+    assert ingestion.read().empty
+    assert ingestion.nrejected == 5
+    assert [error.line for error in ingestion.errors] == [2, 3]
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Peak memory of nested stages.
+@author: Andres Felipe Ramos Padilla
+"""
+import tracemalloc
+
+import numpy as np
+
+from diagism.instrument import StageTimer
+
+
+def test_nested_peaks():
+    timer = StageTimer(trace_memory=True)
+    with timer.stage('outer'):
+        block = np.ones(1 << 22)
+        del block
+        with timer.stage('inner'):
+            pass
+    assert timer.stages['outer']['peak_mb'] >= 32
+    assert timer.stages['inner']['peak_mb'] < 1
+    assert not tracemalloc.is_tracing()
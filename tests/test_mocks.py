@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Random streams of the mocks, drawn in several blocks of galaxies.
+@author: Andres Felipe Ramos Padilla
+"""
+import numpy as np
+
+from diagism import mocks
+from diagism.adaptive import _PersistentStreams
+from diagism.grid import _SameSeed
+
+NGAL = 2*mocks.DRAW_GALAXIES + 5
+NROWS = 50
+
+
+def statistics(ngal=NGAL):
+    rng = np.random.default_rng(0)
+    values = rng.normal(7, 1, (ngal, 4))
+    values[:, 1] = np.nan
+    values[:, -1] = 0.3
+    return values, np.where(np.isnan(values), 7.0, values), np.full(values.shape, 0.3)
+
+
+def draw(values, mean, std, rng):
+    return mocks.draw_mocks(values, mean, std, 0.2, False, rng, NROWS)
+
+
+def test_same_seed():
+    values, mean, std = statistics()
+    cube = draw(values, mean, std, _SameSeed(mocks.SEED))
+    for igal in (0, mocks.DRAW_GALAXIES, NGAL-1):
+        alone = draw(values[igal:igal+1], mean[igal:igal+1], std[igal:igal+1],
+                     np.random.RandomState(mocks.SEED))
+        np.testing.assert_array_equal(cube[igal], alone[0])
+
+
+def test_persistent_streams():
+    values, mean, std = statistics()
+    streams = _PersistentStreams(NGAL)
+    first = draw(values, mean, std, streams)
+    np.testing.assert_array_equal(first, draw(values, mean, std, mocks.GalaxyStreams()))
+    # The next batch continues the stream of each galaxy that is still active
+    active = np.arange(3, NGAL, 2)
+    streams.active = active
+    second = draw(values[active], mean[active], std[active], streams)
+    for irow, igal in enumerate(active):
+        alone = _PersistentStreams(1, first=igal)
+        draw(values[igal:igal+1], mean[igal:igal+1], std[igal:igal+1], alone)
+        alone.active = np.arange(1)
+        np.testing.assert_array_equal(
+            second[irow], draw(values[igal:igal+1], mean[igal:igal+1], std[igal:igal+1],
+                               alone)[0])
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LRU of the results bounded in bytes, in memory and on disk.
+@author: Andres Felipe Ramos Padilla
+"""
+import os
+import shutil
+
+import numpy as np
+
+from diagism import result_cache
+from diagism.resources import HYPERPARAMETERS_FILE
+from diagism.result_cache import ResultCache, result_key
+
+# 1000 float64 values, 8000 bytes
+VALUES = np.arange(1000.0)
+
+
+def test_memory_budget():
+    cache = ResultCache(memory_size=20000)
+    cache.put('a', {'values': VALUES})
+    cache.put('b', {'values': VALUES + 1})
+    assert cache.get('a') is not None
+    cache.put('c', {'values': VALUES + 2})
+    assert cache.get('b') is None
+    np.testing.assert_array_equal(cache.get('a')['values'], VALUES)
+    np.testing.assert_array_equal(cache.get('c')['values'], VALUES + 2)
+    cache.put('d', {'values': np.arange(3000.0)})
+    assert cache.get('d') is None
+    assert cache.get('a') is not None
+
+
+def test_disk_budget(tmp_path):
+    directory = str(tmp_path)
+    cache = ResultCache(memory_size=0, directory=directory, disk_size=20000)
+    for age, key in enumerate('ab'):
+        cache.put(key, {'values': VALUES + age})
+        # Modification times a second apart give a definite LRU order
+        os.utime(os.path.join(directory, key + '.pkl'), (age + 1, age + 1))
+    cache.put('c', {'values': VALUES + 2})
+    assert sorted(os.listdir(directory)) == ['b.pkl', 'c.pkl']
+    assert sum(os.path.getsize(os.path.join(directory, name))
+               for name in os.listdir(directory)) <= 20000
+    assert cache.get('a') is None
+    np.testing.assert_array_equal(cache.get('b')['values'], VALUES + 1)
+
+
+def test_stale_after_data_change(tmp_path, monkeypatch):
+    hyperparameters = str(tmp_path / 'Hyperparameters_table.csv')
+    shutil.copy(HYPERPARAMETERS_FILE, hyperparameters)
+    monkeypatch.setattr(result_cache, 'HYPERPARAMETERS_FILE', hyperparameters)
+    directory = str(tmp_path / 'results')
+
+    def key():
+        return result_key(VALUES.reshape(-1, 1), range(len(VALUES)), ['z'], ['SFR'],
+                          'eight', 1.0, 0, 100)
+
+    old_key = key()
+    ResultCache(directory=directory).put(old_key, {'values': VALUES})
+    assert ResultCache(directory=directory).get(old_key) is not None
+    with open(hyperparameters, 'a') as file:
+        file.write('\n')
+    new_key = key()
+    assert new_key != old_key
+    assert ResultCache(directory=directory).get(new_key) is None